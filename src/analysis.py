@@ -7,7 +7,7 @@ from sqlalchemy.orm.session import make_transient
 
 from src.parameters import Parameters
 from src.histogram import Histogram
-from src.dataset import Lightcurve
+from src.dataset import DatasetMixin, Lightcurve
 from src.database import Session
 from src.source import Source
 from src.properties import Properties
@@ -295,8 +295,11 @@ class Analysis:
                                         f"reduced_{dt} (number {i}) on Source {source.id} "
                                         "has no filename. Did you forget to save it?"
                                     )
-                            [data.save() for data in getattr(source, f"processed_{dt}")]
-                            [data.save() for data in getattr(source, f"simulated_{dt}")]
+                            # open each file only once for all the datasets
+                            DatasetMixin.save_many(
+                                getattr(source, f"processed_{dt}")
+                                + getattr(source, f"simulated_{dt}")
+                            )
 
                     session.commit()
 
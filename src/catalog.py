@@ -606,7 +606,59 @@ class Catalog:
         else:
             raise ValueError('Parameter "output" must be "raw" or "dict"')
 
-    def dict_from_row(self, row, obstime=None):
+    def get_rows(self, start, stop, obstime=None):
+        """
+        Get a range of rows from the catalog, each one as a dictionary.
+        This is equivalent to calling get_row(i, "number", "dict", obstime)
+        for each index from start to stop, but it slices the catalog
+        only once and converts all the coordinates together,
+        which is much faster than doing it row by row.
+
+        Parameters
+        ----------
+        start: int
+            The index of the first row.
+        stop: int
+            The index after the last row.
+        obstime: astropy.time.Time
+            The time of observation. If given, will apply
+            proper motion to the sources based on the time
+            the catalog was observed relative to the given time.
+
+        Returns
+        -------
+        list of dict
+            The rows in the given range, using dict_from_row().
+        """
+        if self.data is None:
+            raise ValueError("Catalog not loaded.")
+        if len(self.data) == 0:
+            raise ValueError("Catalog is empty.")
+
+        data = self.get_data_slice(slice(int(start), int(stop)))
+        if len(data) == 0:
+            return []
+
+        ra, dec = self._convert_coords(
+            np.asarray(data[self.pars.ra_column]),
+            np.asarray(data[self.pars.dec_column]),
+            np.asarray(data[self.pars.pm_ra_column]) if self.pars.pm_ra_column else 0.0,
+            np.asarray(data[self.pars.pm_dec_column])
+            if self.pars.pm_dec_column
+            else 0.0,
+            np.asarray(data[self.pars.parallax_column]),
+            obstime,
+        )
+
+        if isinstance(data, pd.DataFrame):
+            data = data.to_dict("records")
+
+        return [
+            self.dict_from_row(row, ra_dec=(ra[i], dec[i]))
+            for i, row in enumerate(data)
+        ]
+
+    def dict_from_row(self, row, obstime=None, ra_dec=None):
         """
         Extract the relevant information from a row of the catalog as a dictionary.
 
@@ -618,11 +670,18 @@ class Catalog:
             The time of the observation to use for calculating
             the apparent coordinates for the required survey
             using proper motion of the source.
+        ra_dec: tuple of floats, optional
+            The RA and Dec of the source, if they were already
+            calculated (e.g., for many rows at once).
+            If given, the obstime is ignored.
         """
         index = self.get_index_from_name(row[self.pars.name_column])
         name = self.name_to_string(row[self.pars.name_column])
 
-        ra, dec = self.convert_coords(row, obstime)
+        if ra_dec is None:
+            ra, dec = self.convert_coords(row, obstime)
+        else:
+            ra, dec = ra_dec
 
         mag = float(row[self.pars.mag_column])
         if "mag_err_column" in self.pars:
@@ -696,7 +755,35 @@ class Catalog:
         dec = row[self.pars.dec_column]
         pm_ra = row[self.pars.pm_ra_column] if self.pars.pm_ra_column else 0.0
         pm_dec = row[self.pars.pm_dec_column] if self.pars.pm_dec_column else 0.0
+        parallax = row[self.pars.parallax_column]
 
+        return self._convert_coords(ra, dec, pm_ra, pm_dec, parallax, obstime)
+
+    def _convert_coords(self, ra, dec, pm_ra, pm_dec, parallax, obstime=None):
+        """
+        Convert the coordinates from the catalog's epoch
+        to the output coordinate epoch.
+        The inputs can be scalars or arrays,
+        in which case all coordinates are converted at once.
+
+        Parameters
+        ----------
+        ra, dec: float or array
+            The coordinates in the catalog (in degrees).
+        pm_ra, pm_dec: float or array
+            The proper motion of the sources (in mas/yr).
+        parallax: float or array
+            The parallax of the sources (in mas).
+        obstime: astropy Time (optional)
+            The time of observation to propagate the coordinates
+            using proper motion.
+            If not given, will not apply proper motion.
+
+        Returns
+        -------
+        float, float or arrays
+            The RA and Dec of the objects in the output epoch.
+        """
         coords = SkyCoord(
             ra=ra * u.deg,
             dec=dec * u.deg,
@@ -706,7 +793,7 @@ class Catalog:
             ),  # reference epoch for Gaia DR3
             pm_ra_cosdec=pm_ra * u.mas / u.yr,
             pm_dec=pm_dec * u.mas / u.yr,
-            distance=Distance(parallax=row[self.pars.parallax_column] * u.mas),
+            distance=Distance(parallax=parallax * u.mas),
         )
         if obstime is not None:
             if isinstance(obstime, (str, int, float)):
@@ -745,9 +832,7 @@ class Catalog:
         mag = np.random.uniform(15, 20, number)
         mag_err = np.random.uniform(0.1, 0.5, number)
         filters = np.random.choice(["R", "I", "V"], number)
-        names = []
-        for i in range(len(ra)):
-            names.append(f"J{ra2sex(ra[i])}{dec2sex(dec[i])}")
+        names = np.char.add(np.char.add("J", ra2sex(ra)), dec2sex(dec))
 
         data = {
             "object_id": names,
@@ -4,6 +4,7 @@ import string
 import warnings
 from tables import NaturalNameWarning
 from copy import deepcopy
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
@@ -13,6 +14,7 @@ import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
+import erfa
 from astropy.time import Time
 import h5py
 
@@ -32,6 +34,8 @@ from src.source import Source
 import src.database
 
 PHOT_ZP = 23.9
+# the zero point of the Modified Julian Date (MJD 0)
+MJD_EPOCH = np.datetime64("1858-11-17", "us")
 LOG_BASES = np.log(10) / 2.5
 
 AUTOLOAD = True
@@ -42,6 +46,13 @@ OVERWRITE = False
 UNIFORMITY_THRESHOLD = 0.01
 
 
+class DatasetNotInFile(KeyError):
+    """
+    Raised when loading a dataset from a file
+    that exists, but does not contain the dataset's key.
+    """
+
+
 def simplify(key):
     """
     Cleans up (and bumps to lower case)
@@ -79,6 +90,57 @@ def get_time_offset(time_str):
         return float(val.group(0).replace(" ", ""))
 
 
+@lru_cache(maxsize=1)
+def _leap_second_days():
+    """
+    Get the MJD of all days that end with a change
+    in the UTC-TAI offset (leap seconds).
+    """
+    table = erfa.leap_seconds.get()
+    firsts = np.array(
+        [f"{y:04d}-{m:02d}-01" for y, m in zip(table["year"], table["month"])],
+        dtype="datetime64[D]",
+    )
+    return (firsts - MJD_EPOCH.astype("datetime64[D]")).astype(int) - 1
+
+
+def mjd_to_datetime(mjd):
+    """
+    Convert MJD values (in UTC) into datetime objects.
+    This gives the same results as
+    Time(mjd, format="mjd", scale="utc").datetime,
+    (up to a rounding of one microsecond)
+    but uses numpy datetime arithmetic,
+    which is much faster than making a Time object.
+    Days that end with a leap second are still
+    converted using astropy.
+
+    Parameters
+    ----------
+    mjd: scalar float or array of floats
+        The Modified Julian Dates to convert.
+
+    Returns
+    -------
+    datetime or array of datetime objects
+        The converted times, in the same shape as the input.
+    """
+    mjd = np.asarray(mjd, dtype=float)
+    scalar = mjd.ndim == 0
+    mjd = np.atleast_1d(mjd)
+
+    days = np.floor(mjd)
+    microseconds = np.round((mjd - days) * 86400e6)
+    times = MJD_EPOCH + days.astype("timedelta64[D]")
+    times = (times + microseconds.astype("timedelta64[us]")).astype(object)
+
+    leap = np.isin(days, _leap_second_days())
+    if np.any(leap):
+        times[leap] = Time(mjd[leap], format="mjd", scale="utc").datetime
+
+    return times[0] if scalar else times
+
+
 def add_alias(att):
     return property(
         fget=lambda self: getattr(self, att),
@@ -483,6 +545,11 @@ class DatasetMixin:
                 else:
                     raise ValueError("No key specified and multiple keys found in file")
 
+            if key not in store:
+                raise DatasetNotInFile(
+                    f"No object named {key} in the file {self.get_fullname()}"
+                )
+
             # load the data
             self.data = store.get(key)
             if self.data is None:
@@ -747,6 +814,88 @@ class DatasetMixin:
             Add this string after the internal file key
             (which is the source name or a random string).
 
+        """
+        self._prepare_save(
+            source_name=source_name,
+            ra_deg=ra_deg,
+            ra_minute=ra_minute,
+            ra_second=ra_second,
+            key_prefix=key_prefix,
+            key_suffix=key_suffix,
+        )
+
+        if overwrite is None:
+            overwrite = self.overwrite
+
+        # specific format save functions
+        if self.format == "hdf5":
+            self.save_hdf5(overwrite)
+        elif self.format == "fits":
+            self.save_fits(overwrite)
+        elif self.format == "csv":
+            self.save_csv(overwrite)
+        elif self.format == "json":
+            self.save_json(overwrite)
+        elif self.format == "netcdf":
+            self.save_netcdf(overwrite)
+        else:
+            raise ValueError(f"Unknown format {self.format}")
+
+    @staticmethod
+    def save_many(datasets, overwrite=None, **kwargs):
+        """
+        Save multiple datasets to disk.
+        Datasets with dataframes that go into the same
+        HDF5 file are all written while the file is
+        opened only once. Any other datasets are saved
+        one by one using their own save() method.
+
+        Parameters
+        ----------
+        datasets: list of dataset objects
+            The datasets to save (e.g., Lightcurve objects).
+        overwrite: bool
+            If True, overwrite existing keys in the file.
+            If False, raise an error if a key already exists.
+            If None (default), use the "overwrite" attribute
+            of each object.
+        kwargs: dict
+            Additional arguments used to generate the
+            filename and key of each dataset
+            (e.g., source_name, ra_deg, key_prefix).
+            See the save() method for details.
+        """
+        files = {}
+        for d in datasets:
+            if d.format == "hdf5" and isinstance(d._data, pd.DataFrame):
+                d._prepare_save(**kwargs)
+                files.setdefault(d.get_fullname(), []).append(d)
+            else:
+                d.save(overwrite=overwrite, **kwargs)
+
+        for filename, file_datasets in files.items():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", NaturalNameWarning)
+                with pd.HDFStore(filename) as store:
+                    for d in file_datasets:
+                        d._put_in_store(
+                            store, d.overwrite if overwrite is None else overwrite
+                        )
+
+    def _prepare_save(
+        self,
+        source_name=None,
+        ra_deg=None,
+        ra_minute=None,
+        ra_second=None,
+        key_prefix=None,
+        key_suffix=None,
+    ):
+        """
+        Make sure the dataset has data, a filename and a key,
+        and that the folder it is saved into exists.
+        Used by save() and save_many() before writing the data.
+        The parameters are the same as in save().
         """
         if self._data is None:
             raise ValueError("No data to save!")
@@ -772,28 +921,11 @@ class DatasetMixin:
                 source_name=source_name, prefix=key_prefix, suffix=key_suffix
             )
 
-        if overwrite is None:
-            overwrite = self.overwrite
-
         # make a path if missing
         path = os.path.dirname(self.get_fullname())
         if not os.path.isdir(path):
             os.makedirs(path)
 
-        # specific format save functions
-        if self.format == "hdf5":
-            self.save_hdf5(overwrite)
-        elif self.format == "fits":
-            self.save_fits(overwrite)
-        elif self.format == "csv":
-            self.save_csv(overwrite)
-        elif self.format == "json":
-            self.save_json(overwrite)
-        elif self.format == "netcdf":
-            self.save_netcdf(overwrite)
-        else:
-            raise ValueError(f"Unknown format {self.format}")
-
     def save_hdf5(self, overwrite):
         with warnings.catch_warnings():
             warnings.simplefilter("ignore", NaturalNameWarning)
@@ -804,20 +936,7 @@ class DatasetMixin:
                 )  # this actually works??
             elif isinstance(self._data, pd.DataFrame):
                 with pd.HDFStore(self.get_fullname()) as store:
-                    if self.filekey in store:
-                        if overwrite:
-                            store.remove(self.filekey)
-                        else:
-                            raise ValueError(
-                                f"Key {self.filekey} already exists in file {self.get_fullname()}"
-                            )
-
-                    store.put(self.filekey, self.data)
-                    if self.altdata:
-                        altdata_to_write = self.altdata
-                    else:
-                        altdata_to_write = {}
-                    store.get_storer(self.filekey).attrs["altdata"] = altdata_to_write
+                    self._put_in_store(store, overwrite)
 
             elif isinstance(self._data, np.ndarray):
                 with h5py.File(self.get_fullname(), "w") as f:
@@ -828,6 +947,25 @@ class DatasetMixin:
             else:
                 raise ValueError(f"Unknown data type {type(self._data)}")
 
+    def _put_in_store(self, store, overwrite):
+        """
+        Write the dataframe and its altdata into an open HDFStore.
+        """
+        if self.filekey in store:
+            if overwrite:
+                store.remove(self.filekey)
+            else:
+                raise ValueError(
+                    f"Key {self.filekey} already exists in file {self.get_fullname()}"
+                )
+
+        store.put(self.filekey, self.data)
+        if self.altdata:
+            altdata_to_write = self.altdata
+        else:
+            altdata_to_write = {}
+        store.get_storer(self.filekey).attrs["altdata"] = altdata_to_write
+
     def save_fits(self, overwrite):
         pass
 
@@ -904,9 +1042,7 @@ class DatasetMixin:
             elif simplify(c) in ("mjd",):
                 self.time_info["format"] = "mjd"
                 offset = get_time_offset(c)  # e.g., MJD-12345000
-                self.time_info["to datetime"] = lambda t: Time(
-                    t - offset, format="mjd", scale="utc"
-                ).datetime
+                self.time_info["to datetime"] = lambda t: mjd_to_datetime(t - offset)
                 self.time_info["to mjd"] = lambda t: t + offset
                 self.time_info["offset"] = offset
                 self.colmap["time"] = c
@@ -1190,7 +1326,7 @@ class DatasetMixin:
     # when reducing one dataset into another
     # (only copy if all parent datasets have
     # the same value)
-    default_copy_attributes = [
+    default_copy_attributes = (
         "series_identifier",
         "series_object",
         "autoload",
@@ -1200,12 +1336,12 @@ class DatasetMixin:
         "observatory",
         "cfg_hash",
         "folder",
-    ]
+    )
 
     # automatically update the dictionaries
     # from all parent datasets into a new
     # dictionary in the child dataset(s)
-    default_update_attributes = ["altdata"]
+    default_update_attributes = ("altdata",)
 
 
 # TODO: Do we want to split this off into a separate file?
@@ -1755,14 +1891,14 @@ class Lightcurve(DatasetMixin, Base):
 
         # calculate the fluxes from the magnitudes
         if "mag" in self.colmap and "flux" not in self.colmap:
-            mags = self.data[self.colmap["mag"]]
+            mags = self.data[self.colmap["mag"]].to_numpy()
             fluxes = 10 ** ((-mags + PHOT_ZP) / 2.5)
             self.data["flux"] = fluxes
             self.colmap["flux"] = "flux"
 
             # what about the errors?
             if "magerr" in self.colmap:
-                magerr = self.data[self.colmap["magerr"]]
+                magerr = self.data[self.colmap["magerr"]].to_numpy()
                 self.data["fluxerr"] = fluxes * magerr * LOG_BASES
                 self.colmap["fluxerr"] = "fluxerr"
 
@@ -1816,10 +1952,10 @@ class Lightcurve(DatasetMixin, Base):
         """
         Calculate summary statistics on this lightcurve.
         """
-        fluxes = self.data[self.colmap["flux"]]
+        fluxes = self.data[self.colmap["flux"]].to_numpy()
 
         if "flag" in self.colmap:
-            flags = self.data[self.colmap["flag"]].values.astype(bool)
+            flags = self.data[self.colmap["flag"]].to_numpy().astype(bool)
             fluxes = fluxes[np.invert(flags)]
 
         self.flux_mean = np.nanmean(fluxes) if len(fluxes) else None
@@ -1911,13 +2047,14 @@ class Lightcurve(DatasetMixin, Base):
         and other similar properties on the data.
         """
 
-        snr = self.data[self.colmap["snr"]]
-        flux = self.data[self.colmap["flux"]]
+        snr = self.data[self.colmap["snr"]].to_numpy()
+        flux = self.data[self.colmap["flux"]].to_numpy()
 
         if "flag" in self.colmap:
-            flags = self.data[self.colmap["flag"]].values.astype(bool)
-            snr = snr[np.invert(flags)]
-            flux = flux[np.invert(flags)]
+            # compute the mask of good points only once
+            good = np.invert(self.data[self.colmap["flag"]].to_numpy().astype(bool))
+            snr = snr[good]
+            flux = flux[good]
 
         if len(snr) > 0:
             self.snr_max = np.nanmax(snr)
@@ -1,5 +1,8 @@
 import os
 import json
+import functools
+import concurrent.futures
+import weakref
 
 import numpy as np
 import pandas as pd
@@ -12,6 +15,293 @@ from src.utils import help_with_class, help_with_object, unit_convert_bytes, is_
 
 # TODO: should this be saved to the database?
 
+# when filling a histogram with many more bins than this
+# factor times the number of samples, only update the bins
+# that get new counts, instead of using a dense bincount
+SPARSE_FILL_FACTOR = 16
+
+# the number of samples to fill into the histogram at a time,
+# to limit the size of temporary arrays for very large inputs
+FILL_CHUNK_SIZE = 2**20
+
+# when filling with multiple threads, each thread
+# should get at least this many samples
+MIN_SAMPLES_PER_THREAD = 100000
+
+
+@functools.lru_cache(maxsize=None)
+def _get_strides(shape):
+    """
+    Get the multipliers that convert a multi-dimensional
+    index into a flat index, for a C-ordered array with
+    the given shape (in units of elements, not bytes).
+    The result is cached, as the same few shapes
+    are used over and over when filling a histogram.
+    """
+    strides = [1]
+    for size in reversed(shape[1:]):
+        strides.append(strides[-1] * size)
+
+    return tuple(reversed(strides))
+
+
+def _flat_index(bin_indices, shape):
+    """
+    Convert a list of index arrays (one for each dimension)
+    into a single array of flat indices into an array
+    of the given shape. This is like np.ravel_multi_index,
+    but skips the bounds checking (the indices must
+    already be inside the shape).
+    """
+    strides = _get_strides(tuple(shape))
+    flat_indices = bin_indices[-1].astype(np.intp, copy=True)
+    for idx, stride in zip(bin_indices[:-1], strides[:-1]):
+        flat_indices += idx * stride
+
+    return flat_indices
+
+
+# fixed coordinate arrays are shared (read-only) by all
+# histograms that use the same axis specs, and are released
+# once no histogram is using them anymore
+_COORD_CACHE = weakref.WeakValueDictionary()
+
+
+def _get_fixed_coordinate(name, start, stop, step, units):
+    """
+    Get the values of a fixed range coordinate,
+    reusing the same read-only array for all
+    coordinates with the same name, range and units.
+
+    Parameters
+    ----------
+    name: str
+        The name of the coordinate.
+    start, stop, step: float
+        The range of the coordinate, including the stop value.
+    units: str
+        The units of the coordinate.
+
+    Returns
+    -------
+    np.ndarray
+        The (read-only) values of the coordinate.
+    """
+    key = (name, start, stop, step, units)
+    values = _COORD_CACHE.get(key)
+    if values is None:
+        # use an integer number of bins, as np.arange with
+        # a float step can add or drop the last bin because
+        # of rounding errors
+        nbins = int(round((stop - start) / step)) + 1
+        values = start + step * np.arange(nbins)
+        values.setflags(write=False)
+        _COORD_CACHE[key] = values
+
+    return values
+
+
+def _extract_units(specs):
+    """
+    Split the units (an optional string given as the
+    last element) from the coordinate specs.
+    Returns the remaining specs and the units
+    (an empty string if no units were given).
+    """
+    if len(specs) and isinstance(specs[-1], str):
+        return specs[:-1], specs[-1]
+
+    return specs, ""
+
+
+def _make_dynamic_coordinate(name, specs, units):
+    """
+    Make an empty dynamic coordinate.
+    """
+    ax = xr.DataArray([], dims=[name])
+    ax.attrs["type"] = "dynamic"
+
+    return ax
+
+
+def _make_dynamic_step_coordinate(name, specs, units):
+    """
+    Make a dynamic coordinate with a fixed step,
+    starting with a single value.
+    """
+    ax = xr.DataArray(np.array([specs[0]]), dims=[name])
+    ax.attrs["step"] = specs[-1]
+    ax.attrs["type"] = "dynamic"
+
+    return ax
+
+
+def _make_fixed_coordinate(name, specs, units):
+    """
+    Make a coordinate with a fixed range,
+    with overflow and underflow counters.
+    """
+    start, stop, step = specs
+    ax = xr.DataArray(
+        _get_fixed_coordinate(name, start, stop, step, units),
+        dims=[name],
+    )
+    ax.attrs["step"] = specs[-1]
+    ax.attrs["type"] = "fixed"
+    ax.attrs["overflow"] = 0
+    ax.attrs["underflow"] = 0
+
+    return ax
+
+
+# which function makes the coordinate,
+# based on the number of specs (without units)
+_COORD_HANDLERS = {
+    0: _make_dynamic_coordinate,
+    2: _make_dynamic_step_coordinate,
+    3: _make_fixed_coordinate,
+}
+
+# long names for known coordinates
+_LONG_NAMES = {
+    "mag": "Magnitude",
+    "dmag": "Delta Magnitude",
+    "snr": "Signal to Noise Ratio",
+    "exptime": "Exposure Time",
+    "filt": "Filter",
+}
+
+
+def _fill_counts(counts, bin_indices, valid):
+    """
+    Increment the counts array (in place) with the number
+    of samples that fall into each bin.
+
+    The last dimension is the score, and all the other
+    dimensions are the common (source and obs) axes.
+    Samples are grouped by the row of common bins they
+    fall in, and each row that gets any samples is filled
+    with a bincount of the score values.
+    This way only the rows that get new counts are
+    touched, and each of them is written in one block
+    (which only spans the range of score bins between
+    the lowest and highest score in the samples).
+    If the number of bins to update is much larger than
+    the number of samples, only the bins that get new
+    counts are updated.
+
+    Parameters
+    ----------
+    counts: np.ndarray
+        The array of counts to add to.
+        Must have one dimension for each array
+        in bin_indices (in the same order).
+    bin_indices: list of np.ndarray of int
+        The bin index of each sample along each dimension.
+    valid: np.ndarray of bool
+        Mask of the samples that are inside the range of all axes.
+        Samples that are not valid are not counted.
+    """
+    if not valid.all():
+        bin_indices = [idx[valid] for idx in bin_indices]
+
+    num_samples = len(bin_indices[0])
+    if num_samples == 0:
+        return
+
+    if len(bin_indices) == 1:
+        # the most common case: only the score is given
+        # as an array, so there is only one row to fill
+        rows = None
+        num_rows = 1
+    else:
+        rows = _flat_index(bin_indices[:-1], counts.shape[:-1])
+        rows, row_indices = np.unique(rows, return_inverse=True)
+        num_rows = len(rows)
+
+    # only fill the span of score bins that get new samples,
+    # which can be much narrower than a wide score axis
+    scores = bin_indices[-1]
+    low = int(scores.min())
+    span = int(scores.max()) - low + 1
+
+    if num_rows * span > SPARSE_FILL_FACTOR * num_samples:
+        # the rows are much bigger than the number of samples,
+        # so only touch the bins that actually get new counts,
+        # instead of making a dense array the size of the histogram
+        flat_indices = _flat_index(bin_indices, counts.shape)
+        uniq, new_counts = np.unique(flat_indices, return_counts=True)
+        index = np.unravel_index(uniq, counts.shape)
+    elif rows is None:
+        new_counts = np.bincount(scores - low, minlength=span)
+        index = (..., slice(low, low + span))
+    else:
+        # a dense block with only the rows that get new counts
+        new_counts = np.bincount(
+            row_indices * span + (scores - low), minlength=num_rows * span
+        ).reshape(num_rows, span)
+        index = np.unravel_index(rows, counts.shape[:-1])
+        index += (slice(low, low + span),)
+
+    # the indices are unique, so this adds each count only once
+    counts[index] += new_counts.astype(counts.dtype)
+
+
+def _fill_counts_threaded(counts, bin_indices, valid, num_threads):
+    """
+    Same as _fill_counts, but split the samples between
+    multiple threads. Each thread fills its own private
+    copy of the counts array, so the threads never write
+    to the same memory, and the private arrays are added
+    into the counts array at the end.
+    If there are not enough samples to give each thread
+    at least MIN_SAMPLES_PER_THREAD samples, will use
+    fewer threads (or just call _fill_counts directly).
+
+    Parameters
+    ----------
+    counts: np.ndarray
+        The array of counts to add to.
+    bin_indices: list of np.ndarray of int
+        The bin index of each sample along each dimension.
+    valid: np.ndarray of bool
+        Mask of the samples that are inside the range of all axes.
+    num_threads: int
+        The maximum number of threads to use.
+    """
+    num_samples = len(valid)
+    num_threads = min(num_threads, num_samples // MIN_SAMPLES_PER_THREAD)
+
+    if num_threads <= 1:
+        _fill_counts(counts, bin_indices, valid)
+        return
+
+    def fill_chunk(chunk):
+        private_counts = np.zeros(counts.shape, dtype=counts.dtype)
+        _fill_counts(private_counts, [idx[chunk] for idx in bin_indices], valid[chunk])
+        return private_counts
+
+    edges = np.linspace(0, num_samples, num_threads + 1).astype(int)
+    chunks = [slice(edges[i], edges[i + 1]) for i in range(num_threads)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for private_counts in executor.map(fill_chunk, chunks):
+            counts += private_counts
+
+
+def _as_array(values):
+    """
+    Convert a list, Series, or array of values into a numpy array.
+    If the values are already backed by a numpy array
+    (e.g., a column of a DataFrame) this does not make a copy.
+    Strings stored as python objects (e.g., in a pandas column)
+    are converted into a numpy string array.
+    """
+    values = np.asarray(values)
+    if values.dtype == object and len(values) > 0 and isinstance(values[0], str):
+        values = values.astype(str)
+
+    return values
+
 
 class ParsHistogram(Parameters):
     """
@@ -22,7 +312,9 @@ class ParsHistogram(Parameters):
     either a 3-tuple for a statis axis or
     an empty tuple or 2-tuple for a dynamic axis.
     A static axis is defined as (start, stop, step),
-    using np.arange(start, stop + step, step).
+    with bins centered on start, start + step, ..., stop
+    (the number of bins is rounded to the nearest integer,
+    so stop is always included regardless of float rounding).
     A dynamic axis is defined as (start, step) or ()
     in case of a string based coordinate.
     If given a start and step, it will add bins with the
@@ -39,10 +331,12 @@ class ParsHistogram(Parameters):
     In addition, the dtype parameter controls the underlying
     data type of the histogram arrays.
     Since this is a histogram, the data type
-    must be unsigned integers. Choose uint16 for smaller
+    must be unsigned integers. Choose uint8 or uint16 for smaller
     data sets (in RAM and on disk) when expecting the data
-    to be sparse, or uint32 for larger data sets but without
-    the risk of overflow.
+    to be sparse, or uint32 for larger data sets.
+    If any bin is about to get more counts than the data type
+    can hold, that array is promoted to the next larger type
+    (e.g., uint16 to uint32), so the counts never overflow.
     """
 
     def __init__(self, **kwargs):
@@ -52,7 +346,7 @@ class ParsHistogram(Parameters):
             "dtype",
             "uint32",
             str,
-            "Data type of underlying array (must be uint16 or uint32)",
+            "Data type of underlying array (must be uint8, uint16 or uint32)",
         )
         default_score_coords = {
             "snr": (-20, 20, 0.1),
@@ -95,12 +389,32 @@ class ParsHistogram(Parameters):
             "exists in the histogram source_names set.",
         )
 
+        self.num_threads = self.add_par(
+            "num_threads",
+            0,
+            int,
+            "Number of threads to use when filling the histogram "
+            "with very large arrays of data (0 means no threading).",
+        )
+
+        self.compression_level = self.add_par(
+            "compression_level",
+            1,
+            int,
+            "Compression level (0-9) for the count arrays "
+            "when saving to netCDF (0 means no compression).",
+        )
+
         self._enforce_no_new_attrs = True
 
     def __setattr__(self, key, value):
-        if key == "dtype" and value not in ("uint16", "uint32"):
+        if key == "dtype" and value not in ("uint8", "uint16", "uint32"):
             raise ValueError(
-                f"Unsupported dtype: {value}, " f"must be uint16 or uint32."
+                f"Unsupported dtype: {value}, " f"must be uint8, uint16 or uint32."
+            )
+        if key == "compression_level" and not 0 <= value <= 9:
+            raise ValueError(
+                f"Unsupported compression_level: {value}, must be between 0 and 9."
             )
 
         super().__setattr__(key, value)
@@ -187,6 +501,13 @@ class Histogram:
         self.pars = ParsHistogram(**kwargs)
         self.data = None
 
+        # raw numpy arrays that share memory with self.data,
+        # used to fill the histogram without going through xarray
+        self._counts = {}
+        self._dims = {}
+        self._bin_specs = {}
+        self._max_counts = {}
+
         if can_initialize:
             self.initialize()
 
@@ -243,40 +564,48 @@ class Histogram:
         then explicitly call this function.
         """
 
-        if self.pars.dtype not in ("uint16", "uint32"):
+        if self.pars.dtype not in ("uint8", "uint16", "uint32"):
             raise ValueError(
-                f"Unsupported dtype: {self.pars.dtype}, must be uint16 or uint32."
+                f"Unsupported dtype: {self.pars.dtype}, "
+                f"must be uint8, uint16 or uint32."
             )
 
-        # create the coordinates
+        # create the coordinates, and collect the names and shapes
+        # of the axes shared by all DataArrays, in a single pass
+        pars_dict = {
+            "score": self.pars.score_coords,
+            "source": self.pars.source_coords,
+            "obs": self.pars.obs_coords,
+        }
         coords = {}
-        for input_ in ("score", "source", "obs"):
-            for k, v in getattr(self.pars, f"{input_}_coords").items():
-                coords[k] = self._create_coordinate(k, v)
-                coords[k].attrs["input"] = input_
-
-        data_shape = tuple(
-            len(v) for v in coords.values() if v.attrs["input"] in ("source", "obs")
-        )
-
-        # these coordinates are shared by all the DataArrays
-        common_coord_names = [
-            k for k, v in coords.items() if v.attrs["input"] in ("source", "obs")
-        ]
+        common_names = []
+        common_shape = []
+        score_coords = []
+        for input_, specs_dict in pars_dict.items():
+            for k, v in specs_dict.items():
+                coord = self._create_coordinate(k, v)
+                coord.attrs["input"] = input_
+                coords[k] = coord
+                if input_ == "score":
+                    score_coords.append((k, len(coord)))
+                else:
+                    common_names.append(k)
+                    common_shape.append(len(coord))
 
+        data_shape = tuple(common_shape)
         data_vars = {}
-        for k, v in coords.items():
-            if v.attrs["input"] == "score":
-                data_vars[k + "_counts"] = (
-                    common_coord_names + [k],
-                    np.zeros(data_shape + (len(v),), dtype=self.pars.dtype),
-                )
+        for k, length in score_coords:
+            data_vars[k + "_counts"] = (
+                common_names + [k],
+                np.zeros(data_shape + (length,), dtype=self.pars.dtype),
+            )
 
         self.data = xr.Dataset(data_vars, coords=coords)
         if self.name is not None:
             self.data.attrs["name"] = self.name
 
         self.data.attrs["source_names"] = set()
+        self._update_buffers()
 
         if self.output_folder is None:
             self.output_folder = os.getcwd()
@@ -313,36 +642,14 @@ class Histogram:
         if not isinstance(specs, (tuple, list)):
             raise ValueError(f"Coordinate specs must be a list or tuple: {specs}")
 
-        if len(specs) and isinstance(specs[-1], str):
-            units = specs[-1]
-            specs = specs[:-1]
-        else:
-            units = ""
-
-        if len(specs) == 0:
-            # dynamic range
-            ax = xr.DataArray([], dims=[name])
-            ax.attrs["type"] = "dynamic"
-        elif len(specs) == 2:
-            # dynamic range with a fixed step
-            ax = xr.DataArray(np.array([specs[0]]), dims=[name])
-            ax.attrs["step"] = specs[-1]
-            ax.attrs["type"] = "dynamic"
-        elif len(specs) == 3:
-            # fixed range
-            start, stop, step = specs
-            ax = xr.DataArray(
-                np.arange(start, stop + step, step),
-                dims=[name],
-            )
-            ax.attrs["step"] = specs[-1]
-            ax.attrs["type"] = "fixed"
-            ax.attrs["overflow"] = 0
-            ax.attrs["underflow"] = 0
-        else:
+        specs, units = _extract_units(specs)
+        try:
+            handler = _COORD_HANDLERS[len(specs)]
+        except KeyError:
             raise ValueError(
-                f"Coordinate specs must be a tuple of length 0 or 3: {specs}"
+                f"Coordinate specs must be a tuple of length 0, 2 or 3: {specs}"
             )
+        ax = handler(name, specs, units)
 
         ax.attrs["long_name"] = self._get_coordinate_name(name)
         ax.attrs["units"] = units
@@ -369,13 +676,7 @@ class Histogram:
             Long name of the coordinate
         """
 
-        return {
-            "mag": "Magnitude",
-            "dmag": "Delta Magnitude",
-            "snr": "Signal to Noise Ratio",
-            "exptime": "Exposure Time",
-            "filt": "Filter",
-        }.get(name, name)
+        return _LONG_NAMES.get(name, name)
 
     def get_size(self, units="mb"):
         """
@@ -396,9 +697,7 @@ class Histogram:
             The size of the histogram in memory,
             in whatever units were requested.
         """
-        total_size = 0
-        for d in self.data.data_vars.values():
-            total_size += d.size * d.dtype.itemsize
+        total_size = sum(a.nbytes for a in self._counts.values())
 
         return total_size / unit_convert_bytes(units)
 
@@ -470,8 +769,11 @@ class Histogram:
         or if some of the columns contain unique values,
         those scalar values will be used to slice into
         the histogram, and speed up the binning process.
-        All the other values will be binned using ...
-        # TODO: finish description
+        All the other values will be binned by converting
+        them to bin indices (all axes have uniform bins,
+        so the index is just the distance from the first
+        bin center in units of the step size), and then
+        counting them with a single call to np.bincount.
 
         Parameters
         ----------
@@ -515,11 +817,12 @@ class Histogram:
 
                 if values is not None:
                     if not is_scalar(values):
+                        values = _as_array(values)
                         # an array, but need to check if all are the same
-                        if len(np.unique(values)) == 1:
+                        if len(values) > 0 and np.all(values == values[0]):
                             input_data[axis] = values[0]
                         else:
-                            input_data[axis] = np.array(values)
+                            input_data[axis] = values
                     else:  # a scalar value / string
                         input_data[axis] = values
 
@@ -534,9 +837,6 @@ class Histogram:
         if sample_len is None:
             sample_len = 1
 
-        # how many different scores are we tracking? (snr, dmag, etc)
-        num_scores = len(self.data.data_vars)
-
         # check all data axes have a coordinate value or values array
         for axis in self.data.dims:
             if input_data[axis] is None:
@@ -547,145 +847,245 @@ class Histogram:
         # range of any of the dynamic axes.
         # If so, expand the axes to include the new values.
         for axis in self.data.dims:
-            if self.data.coords[axis].attrs["type"] == "fixed":
+            coord = self.data.coords[axis]
+            if coord.attrs["type"] == "fixed":
                 continue  # no need to expand fixed axes
 
+            values = input_data[axis]
+
             # scalar string
-            if isinstance(input_data[axis], str):
-                if (
-                    self.data.coords[axis].size == 0
-                    or input_data[axis] not in self.data.coords[axis].values
-                ):
-                    self._expand_axis(axis, input_data[axis])
-
-            # list of strings
-            elif hasattr(input_data[axis], "__len__") and all(
-                isinstance(x, str) for x in input_data[axis]
-            ):
-                if not set(input_data[axis]).issubset(self.data.coords[axis].values):
-                    self._expand_axis(axis, input_data[axis])
+            if isinstance(values, str):
+                if coord.size == 0 or values not in coord.values:
+                    self._expand_axis(axis, values)
+
+            # array of strings
+            elif not is_scalar(values) and values.dtype.kind in ("U", "S"):
+                if not np.all(np.isin(values, coord.values)):
+                    self._expand_axis(axis, list(np.unique(values)))
             else:
-                mx = max(self.data[axis] + self.data[axis].attrs["step"] / 2)
-                mn = min(self.data[axis] - self.data[axis].attrs["step"] / 2)
-                if hasattr(input_data[axis], "__len__"):
-                    new_mx = max(input_data[axis])
-                    new_mn = min(input_data[axis])
-                else:
-                    new_mx = input_data[axis]
-                    new_mn = input_data[axis]
-                if new_mx > mx or new_mn < mn:
-                    self._expand_axis(axis, input_data[axis])
+                start, inv_step, nbins = self._bin_specs[axis]
+                mn = start - 0.5 / inv_step
+                mx = start + (nbins - 0.5) / inv_step
+                if np.max(values) > mx or np.min(values) < mn:
+                    self._expand_axis(axis, values)
+
+        # make sure all array values have the same length
+        for values in input_data.values():
+            if not is_scalar(values) and len(values) != sample_len:
+                raise ValueError("Array values must all have the same length!")
+
+        # fill the histogram in chunks, so the temporary
+        # arrays (e.g., of bin indices) do not get too big
+        for i in range(0, sample_len, FILL_CHUNK_SIZE):
+            chunk = slice(i, i + FILL_CHUNK_SIZE)
+            chunk_data = {
+                ax: v if is_scalar(v) else v[chunk] for ax, v in input_data.items()
+            }
+            self._fill(chunk_data, min(FILL_CHUNK_SIZE, sample_len - i))
+
+    def _fill(self, input_data, sample_len):
+        """
+        Increase the bin counts using the input data.
+        This is called by add_data after all the inputs
+        are collected, and all the dynamic axes have
+        been expanded to accommodate the new values.
+
+        Parameters
+        ----------
+        input_data: dict
+            A dictionary with a key for each axis,
+            and either a scalar or an array of values.
+        sample_len: int
+            The number of samples (the length of the arrays).
+        """
+        # scalar values are used to index into the arrays directly,
+        # while arrays of values are converted into bin indices.
+        # This is done once for each axis, since the common
+        # (source and obs) axes are shared by all the scores.
+        indices = {}  # index of each scalar value
+        out_of_range = set()  # axes with scalar values outside the range
+        for axis in self.data.dims:
+            if is_scalar(input_data[axis]):
+                indices[axis] = self._get_index(axis, input_data[axis])
+                coord = self.data.coords[axis]
+                if coord.attrs["type"] == "fixed":
+                    if indices[axis] < 0:
+                        coord.attrs["underflow"] += sample_len
+                        out_of_range.add(axis)
+                    elif indices[axis] >= coord.size:
+                        coord.attrs["overflow"] += sample_len
+                        out_of_range.add(axis)
+                    # else: do nothing, there's no overflow/underflow
+
+        if not self._counts:
+            return  # there are no score axes to fill
+
+        common_dims = self._dims[next(iter(self._counts))][:-1]
+        if any(ax in out_of_range for ax in common_dims):
+            return  # none of the scores can be filled
+
+        # bin the common axes that have arrays of values
+        # (ordered by the dimensions of the data arrays)
+        common_index = tuple(indices.get(ax, slice(None)) for ax in common_dims)
+        bin_indices = []
+        valid = np.ones(sample_len, dtype=bool)
+        for ax in common_dims:
+            if ax not in indices:
+                idx, in_range = self._get_bin_indices(ax, input_data[ax])
+                bin_indices.append(idx)
+                valid &= in_range
 
         # here is where we actually increase the bin counts
-        for name, da in self.data.data_vars.items():
-            # each da is a DataArray for a different score
+        for name in list(self._counts.keys()):
+            # each counts_array is the raw data for a different score
+            score = self._dims[name][-1]
+            if score in out_of_range:
+                continue
+
+            counts_array = self._check_overflow(name, sample_len)
+
+            # a view into the raw array, with any scalar values
+            # used to index the matching axes
+            counts_slice = counts_array[common_index]
+            if score in indices:
+                counts_slice = counts_slice[..., indices[score]]
+                score_indices = bin_indices
+                score_valid = valid
+            else:
+                idx, in_range = self._get_bin_indices(score, input_data[score])
+                score_indices = bin_indices + [idx]
+                score_valid = valid & in_range
+
+            if not score_indices:
+                # all values are scalars, just add the number of measurements
+                counts_array[common_index + (indices[score],)] += np.array(
+                    sample_len
+                ).astype(counts_array.dtype)
+            elif self.pars.num_threads > 1:
+                _fill_counts_threaded(
+                    counts_slice, score_indices, score_valid, self.pars.num_threads
+                )
+            else:
+                _fill_counts(counts_slice, score_indices, score_valid)
 
-            # get a slice of the full array that matches any scalar values
-            indices = {}
-            array_values = {}
-            for ax in da.dims:
-                if is_scalar(input_data[ax]):
-                    indices[ax] = self._get_index(ax, input_data[ax])
-                else:
-                    array_values[ax] = input_data[ax]
+    def _check_overflow(self, name, num_new):
+        """
+        Make sure adding new samples to one of the arrays
+        cannot overflow its (unsigned integer) data type.
+        If it could, the array is promoted to the next
+        larger data type (e.g., uint16 to uint32).
 
-            # make sure all array values have the same length
-            for v in array_values.values():
-                if len(v) != sample_len:
-                    raise ValueError("Array values must all have the same length!")
+        To avoid scanning the array on every call,
+        keeps track of an upper bound on the maximum
+        count in each array, and only checks the actual
+        maximum when that upper bound is near the limit.
 
-            # for all static axes, keep track of the
-            # overflow/underflow counts
-            in_range = True  # if any scalars are out of range, will be false
-            for ax in da.dims:
-                if da.coords[ax].attrs["type"] == "fixed":
-                    if da.coords[ax].attrs["input"] == "score":
-                        num_values_to_add = sample_len
-                    else:
-                        # because the common axes are shared by all scores
-                        # we will end up adding the sample_len multiple times
-                        num_values_to_add = sample_len / num_scores
-
-                    if ax in indices and indices[ax] < 0:
-                        da.coords[ax].attrs["underflow"] += num_values_to_add
-                        in_range = False
-                    elif ax in indices and indices[ax] >= len(da.coords[ax]):
-                        da.coords[ax].attrs["overflow"] += num_values_to_add
-                        in_range = False
-                    # else: do nothing, there's no overflow/underflow
+        Parameters
+        ----------
+        name: str
+            Name of the DataArray to check.
+        num_new: int
+            Number of samples that are going to be added.
+            This is the most that any bin can grow by.
 
-            if in_range:
-                # if all the arrays have unique values, just add the number of measurements:
-                if not array_values:  # empty dict
-                    # TODO: check that this actually works...
-                    self.data[name][indices] += np.array(sample_len).astype(da.dtype)
-                else:
-                    # bin the non-unique dataframe columns into the appropriate axes
-                    da_slice = self.data[name].isel(**indices)
-                    if set(da_slice.dims) != set(array_values.keys()):
-                        raise ValueError("Slice into data array has wrong dimensions!")
-
-                    # setup the bin edges and values
-                    # make sure they're ordered by the da_slice dims
-                    bins = []  # array of bin edges
-                    values = []  # array of new values to count
-                    for dim in da_slice.dims:
-                        centers = da_slice.coords[dim].values
-
-                        # convert strings to numbers:
-                        if centers.dtype.kind in ("S", "U"):
-                            # lookup table shows the order of strings in the coordinate
-                            lookup = {val: ind for ind, val in enumerate(centers)}
-
-                            # convert to numbers according
-                            # to alphabetical order
-                            uniq, rev_ind = np.unique(
-                                array_values[dim], return_inverse=True
-                            )
-
-                            # convert alphabetical order to the order
-                            # of values in the lookup table
-                            # ref: https://stackoverflow.com/a/16993364/18256949
-                            ordered_array = np.array([lookup[x] for x in uniq])[rev_ind]
-
-                            # ordered_array should be a list of numbers,
-                            # each representing a string, according to the
-                            # order of strings in the axis.
-                            values.append(ordered_array)
-                            edges = np.arange(-0.5, len(centers) + 0.5, 1)
-                        else:  # get bin edges from center values
-                            step = da_slice.coords[dim].attrs["step"]
-                            edges = np.concatenate(
-                                [[centers[0] - step / 2], centers + step / 2]
-                            )
-
-                            values.append(array_values[dim])
-                        bins.append(edges)
-
-                    counts, _ = np.histogramdd(values, bins)
-                    da_slice += counts.astype(da.dtype)  # add to existing counts
-
-                    # add the over/underflow:
-                    for ax in array_values:
-                        if da_slice.coords[ax].attrs["type"] == "fixed":
-                            if da_slice.coords[ax].attrs["input"] == "score":
-                                correction = 1
-                            else:
-                                # because the common axes are shared by all scores
-                                # we will end up adding the sample_len multiple times
-                                correction = 1 / num_scores
-                            mx = max(da_slice.coords[ax].values)
-                            mn = min(da_slice.coords[ax].values)
-                            step = da_slice.coords[ax].attrs["step"]
-                            num_values_to_add = np.sum(array_values[ax] > mx + step / 2)
-
-                            self.data[name][ax].attrs["overflow"] += (
-                                num_values_to_add * correction
-                            )
-                            num_values_to_add = np.sum(array_values[ax] < mn - step / 2)
-                            self.data[name][ax].attrs["underflow"] += (
-                                num_values_to_add * correction
-                            )
+        Returns
+        -------
+        np.ndarray
+            The raw array of counts, which may have been
+            replaced by a larger data type.
+        """
+        counts_array = self._counts[name]
+        limit = np.iinfo(counts_array.dtype).max
+        max_counts = self._max_counts.get(name)
+        if max_counts is None or max_counts + num_new > limit:
+            max_counts = int(counts_array.max()) if counts_array.size else 0
+
+            while max_counts + num_new > limit:
+                if counts_array.dtype == np.uint64:
+                    raise OverflowError(f"Too many counts in {name}!")
+                new_dtype = np.dtype(f"u{counts_array.dtype.itemsize * 2}")
+                self.data[name] = self.data[name].astype(new_dtype)
+                self._update_buffers()
+                counts_array = self._counts[name]
+                limit = np.iinfo(counts_array.dtype).max
+
+        self._max_counts[name] = max_counts + num_new
+
+        return counts_array
+
+    def _get_bin_indices(self, axis, values):
+        """
+        Convert an array of values into indices of the bins
+        along one of the axes. Also updates the overflow and
+        underflow counts for fixed axes.
+
+        The coordinates all have uniform bins, so instead of
+        searching for the bin edges we can get the bin index
+        directly from the distance to the first bin center.
+
+        Parameters
+        ----------
+        axis: str
+            Name of the coordinate to bin the values into.
+        values: array-like
+            The values to convert to bin indices.
+            Can be numbers or strings (for string-based axes).
+
+        Returns
+        -------
+        idx: np.ndarray of int
+            The index of the bin for each value.
+        in_range: np.ndarray of bool
+            Mask of the values that fall inside the axis.
+        """
+        coord = self.data.coords[axis]
+        centers = coord.values
+
+        # convert strings to numbers:
+        if centers.dtype.kind in ("S", "U"):
+            # string axes are not sorted (new values are appended
+            # at the end) so look up each value in a sorted copy
+            # of the axis, and map it back to the original order
+            values = np.asarray(values, dtype=str)
+            order = np.argsort(centers)
+            pos = np.searchsorted(centers[order], values)
+            pos[pos == len(centers)] = 0  # do not index past the end
+            if np.any(centers[order][pos] != values):
+                missing = set(values) - set(centers)
+                raise ValueError(f"Values {missing} not in axis {axis}")
+            idx = order[pos]
+            return idx, np.ones(len(idx), dtype=bool)
+
+        # uniform bins around the center values
+        start, inv_step, nbins = self._bin_specs[axis]
+        # reuse one float buffer for all the steps,
+        # instead of allocating a new array for each one
+        buffer = np.subtract(values, start, dtype=np.float64)
+        buffer *= inv_step
+        buffer += 0.5
+        np.floor(buffer, out=buffer)
+
+        # NaN/inf values cannot be cast to integers,
+        # so they are zeroed here and masked out below
+        finite = np.isfinite(buffer)
+        buffer[~finite] = 0
+        idx = buffer.astype(np.intp)
+
+        # a single unsigned comparison checks both ends of the range,
+        # since negative indices wrap around to very large numbers
+        in_range = idx.view(np.uintp) < nbins
+        in_range &= finite
+
+        # add the over/underflow (non-finite values are not counted):
+        if coord.attrs["type"] == "fixed":
+            num_overflow = np.count_nonzero(idx >= nbins)
+            num_underflow = (
+                np.count_nonzero(finite) - np.count_nonzero(in_range) - num_overflow
+            )
+            coord.attrs["overflow"] += num_overflow
+            coord.attrs["underflow"] += num_underflow
+
+        return idx, in_range
 
     def _expand_axis(self, axis, new_values):
         """
@@ -733,23 +1133,26 @@ class Histogram:
             else:  # scalar or array of numbers
                 if not hasattr(new_values, "__len__"):
                     new_values = [new_values]
+                old_coord = self.data[axis].values
                 step = self.data[axis].attrs["step"]
-                mx = max(max(new_values), max(self.data[axis].values))
-                mx = round(mx / step) * step  # round to nearest step
-                mn = min(min(new_values), min(self.data[axis].values))
-                mn = round(mn / step) * step  # round to nearest step
 
-                # the new values up to the original axis
-                lower = np.arange(mn, min(self.data[axis]), step)
-                if np.isclose(lower[-1], min(self.data[axis])):
-                    lower = lower[:-1]
+                # the (integer) bin index of the new min/max values,
+                # relative to the first bin of the original axis
+                index_mn = int(
+                    np.floor((np.min(new_values) - old_coord[0]) / step + 0.5)
+                )
+                index_mx = int(
+                    np.floor((np.max(new_values) - old_coord[0]) / step + 0.5)
+                )
 
-                new_coord = np.concatenate((lower, self.data[axis]))
+                # the new values up to the original axis
+                lower = old_coord[0] + step * np.arange(min(index_mn, 0), 0)
 
                 # the new values after the original axis
-                upper = np.arange(max(new_coord) + step, mx + step, step)
+                num_upper = max(index_mx - (len(old_coord) - 1), 0)
+                upper = old_coord[-1] + step * np.arange(1, num_upper + 1)
 
-                new_coord = np.concatenate((new_coord, upper))
+                new_coord = np.concatenate((lower, old_coord, upper))
 
         # make a new array with all the same coords,
         # except replace the one axis with the new coord
@@ -788,6 +1191,34 @@ class Histogram:
         new_dataset = xr.Dataset(new_data)
         new_dataset.attrs = self.data.attrs.copy()
         self.data = new_dataset
+        self._update_buffers()
+
+    def _update_buffers(self):
+        """
+        Keep a reference to the underlying numpy arrays
+        of each DataArray (and their dimensions),
+        so that add_data can increment the counts
+        directly, without the overhead of xarray indexing.
+        Also caches the (start, inv_step, nbins) of each
+        numeric axis, used to convert values to bin indices.
+        Must be called whenever self.data is replaced.
+        """
+        self._counts = {}
+        self._dims = {}
+        self._bin_specs = {}
+        self._max_counts = {}
+        if self.data is not None:
+            for name, da in self.data.data_vars.items():
+                self._counts[name] = da.values
+                self._dims[name] = da.dims
+
+            for name, coord in self.data.coords.items():
+                if "step" in coord.attrs and coord.size > 0:
+                    self._bin_specs[name] = (
+                        float(coord.values[0]),
+                        1.0 / float(coord.attrs["step"]),
+                        coord.size,
+                    )
 
     def _get_index(self, axis, value):
         """
@@ -818,13 +1249,14 @@ class Histogram:
                 raise ValueError(f"Value {value} not in axis {axis}")
             return np.where(self.data.coords[axis].values == value)[0][0]
         else:
-            step = self.data.coords[axis].attrs["step"]
-            if value > max(self.data.coords[axis].values) + step / 2:
-                return self.data.coords[axis].size
-            elif value < min(self.data.coords[axis].values) - step / 2:
+            start, inv_step, nbins = self._bin_specs[axis]
+            index = int(np.floor((value - start) * inv_step + 0.5))
+            if index >= nbins:
+                return nbins
+            elif index < 0:
                 return -1
             else:
-                return np.argmin(np.abs(self.data.coords[axis].values - value))
+                return index
 
     @staticmethod
     def from_netcdf(filename):
@@ -849,6 +1281,7 @@ class Histogram:
 
         h.output_folder = folder
         h.data = data
+        h._update_buffers()
 
         return h
 
@@ -884,6 +1317,8 @@ class Histogram:
             if "source_names" in self.data.attrs:
                 self.data.attrs["source_names"] = set(self.data.attrs["source_names"])
 
+            self._update_buffers()
+
     def save(self, suffix=None):
         """
         Save the data to the file.
@@ -904,7 +1339,20 @@ class Histogram:
         # netCDF files can't store dicts, must convert to string
         self.data.attrs["pars"] = json.dumps(self.pars.to_dict())
         self.data.attrs["source_names"] = list(self.data.attrs["source_names"])
-        self.data.to_netcdf(os.path.join(self.output_folder, filename), mode="w")
+
+        # sparse counts compress very well, and setting the dtype
+        # explicitly avoids casting promoted arrays back to the
+        # dtype that was used when the file was first loaded
+        level = self.pars.compression_level
+        encoding = {}
+        for name, da in self.data.data_vars.items():
+            encoding[name] = {"dtype": da.dtype}
+            if level > 0:
+                encoding[name].update(zlib=True, complevel=level)
+
+        self.data.to_netcdf(
+            os.path.join(self.output_folder, filename), mode="w", encoding=encoding
+        )
 
     def remove_data_from_file(self, suffix=None):
         """
@@ -1,29 +1,125 @@
 import time
 import os
+import math
 import glob
-import copy
 import re
 import yaml
-import validators
 import numpy as np
 import pandas as pd
 import threading
+import multiprocessing
+import itertools
+import operator
+import collections
 import concurrent.futures
 
 import sqlalchemy as sa
 from src.database import Session
 from src.parameters import (
+    YAML_LOADER,
     Parameters,
     convert_data_type,
     normalize_data_types,
     get_class_from_data_type,
 )
 from src.source import Source, get_source_identifiers
-from src.dataset import DatasetMixin, RawPhotometry, Lightcurve
+from src.dataset import DatasetMixin, DatasetNotInFile, RawPhotometry, Lightcurve
 from src.catalog import Catalog
 from src.utils import help_with_class, help_with_object
 
-lock = threading.Lock()
+
+def _fetch_in_process(observatory, cat_row, fetch_args):
+    """
+    Fetch the data for one source in a worker process.
+    This must be a module level function so
+    it can be sent to a process pool.
+    """
+    return observatory.fetch_data_from_observatory(cat_row, **fetch_args)
+
+
+# the root folder of the repository, where the
+# credentials file is looked for by default
+_BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# the content of each credentials file that was read,
+# along with its modification time, so the file is
+# only parsed again if it has changed
+_credentials_cache = {}
+
+
+def _load_credentials_file(filepath):
+    """
+    Read a YAML file with credentials for any number
+    of observatories, and return its content as a dictionary.
+    The file is only read again if it was modified
+    since the last time it was loaded.
+    """
+    mtime = os.path.getmtime(filepath)
+    cached = _credentials_cache.get(filepath)
+    if cached is None or cached[0] != mtime:
+        with open(filepath) as file:
+            cached = (mtime, yaml.load(file, Loader=YAML_LOADER))
+        _credentials_cache[filepath] = cached
+
+    return cached[1]
+
+
+# marks attributes that are not defined on an object
+# (None could be a legitimate value of the attribute)
+_MISSING = object()
+
+# find the number inside a dataset key (e.g., "/source_00123")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def _number_from_key(key):
+    """
+    Get the (first) integer that appears in a dataset key.
+    Keys that are just a number (e.g., "/00123") are
+    converted directly, without going through the regex.
+    """
+    name = key.lstrip("/")
+    if name.isdecimal():
+        return int(name)
+
+    match = _DIGITS_RE.search(key)
+    if match is None:
+        raise ValueError(f'Could not find a number in the dataset key "{key}".')
+
+    return int(match.group())
+
+
+def _iter_store_keys(store):
+    """
+    Go over the keys of all pandas objects in an HDFStore,
+    one group at a time (using store.walk()),
+    instead of listing all the keys in the file up front.
+    For files with keys at a single level this is the
+    same order as store.keys().
+    """
+    for path, _, leaves in store.walk():
+        for leaf in leaves:
+            yield f"{path}/{leaf}"
+
+
+# each data file gets its own lock, so threads can
+# load/save different files at the same time, but never
+# access the same file concurrently
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def _get_file_lock(filename):
+    """
+    Get the lock associated with a data file.
+    The same lock is returned for all calls
+    with the same (absolute) path.
+    """
+    filename = os.path.abspath(filename)
+    with _file_locks_guard:
+        if filename not in _file_locks:
+            _file_locks[filename] = threading.Lock()
+        return _file_locks[filename]
 
 
 class ParsObservatory(Parameters):
@@ -129,9 +225,25 @@ class ParsObservatory(Parameters):
             int,
             "Number of sources to download and hold in RAM at one time",
         )
+        self.commit_batch_size = self.add_par(
+            "commit_batch_size",
+            1000,
+            int,
+            "Number of new sources to add to the database "
+            "in each commit when populating sources from files",
+        )
         self.num_threads_download = self.add_par(
             "num_threads_download", 0, int, "Number of threads to use for downloading"
         )
+        self.download_pool_type = self.add_par(
+            "download_pool_type",
+            "thread",
+            str,
+            'Use "thread" to fetch data in the download threads, '
+            'or "process" to run fetch_data_from_observatory in '
+            "separate processes, which is faster when parsing the "
+            "downloaded data is CPU bound.",
+        )
         self.download_pars_list = self.add_par(
             "download_pars_list",
             [],
@@ -177,10 +289,11 @@ class ParsObservatory(Parameters):
             by the kwargs that are passed when constructing
             the Parameters object.
         """
-        for key, value in inputs.items():
-            if key.upper() == self.obs_name:
-                for k, v in value.items():
-                    self[k] = v
+        specific = {key.upper(): value for key, value in inputs.items()}
+        overrides = specific.get(self.obs_name)
+        if overrides:
+            for k, v in overrides.items():
+                self[k] = v
 
     def __setattr__(self, key, value):
         """
@@ -193,6 +306,10 @@ class ParsObservatory(Parameters):
             return
         if key == "data_types":
             value = normalize_data_types(value)
+        if key == "download_pool_type" and value not in ("thread", "process"):
+            raise ValueError(
+                f'download_pool_type must be "thread" or "process", not "{value}"'
+            )
 
         super().__setattr__(key, value)
 
@@ -215,6 +332,10 @@ class VirtualObservatory:
     save the results for later, and so on.
     """
 
+    # the relational collections on Source, for each data type,
+    # other than the raw data (e.g., "reduced_photometry")
+    _EMPTY_COLLECTIONS = ("reduced", "processed", "simulated")
+
     def __init__(self, name=None):
         """
         Create a new VirtualObservatory object,
@@ -234,6 +355,19 @@ class VirtualObservatory:
         self._credentials = {}  # dictionary with usernames/passwords
         self._catalog = None
 
+        # a thread pool that is reused for all download batches
+        self._download_executor = None
+        self._download_executor_size = None
+
+        # a process pool for fetching the data (if download_pool_type="process")
+        self._fetch_executor = None
+        self._fetch_executor_size = None
+
+        # data classes and attribute names for each data type,
+        # recalculated only if pars.data_types is changed
+        self._data_classes = ()
+        self._data_classes_key = None
+
         # freshly downloaded data:
         self.sources = []
         self.datasets = []
@@ -279,6 +413,144 @@ class VirtualObservatory:
 
         self._catalog = catalog
 
+    def _get_data_classes(self):
+        """
+        Get the data types of this observatory, along
+        with the class and the name of the Source attribute
+        holding the raw data, for each data type.
+        These are only recalculated when pars.data_types changes,
+        so they can be used for each source without having
+        to look up the classes or format the attribute names.
+
+        Returns
+        -------
+        tuple of tuples
+            Each tuple is (data_type, data_class, raw_attribute, other_attributes),
+            e.g., ("photometry", RawPhotometry, "raw_photometry",
+            ("reduced_photometry", "processed_photometry", "simulated_photometry")).
+        """
+        data_types = tuple(self.pars.data_types)
+        if data_types != self._data_classes_key:
+            self._data_classes = tuple(
+                (
+                    dt,
+                    get_class_from_data_type(dt),
+                    f"raw_{dt}",
+                    tuple(f"{n}_{dt}" for n in self._EMPTY_COLLECTIONS),
+                )
+                for dt in data_types
+            )
+            self._data_classes_key = data_types
+
+        return self._data_classes
+
+    def _get_download_executor(self):
+        """
+        Get the thread pool used for downloading data.
+        The pool is created the first time it is needed
+        and is reused for all following download batches.
+        It is only re-created if the number of threads
+        (pars.num_threads_download) has changed.
+        """
+        num_threads = max(self.pars.num_threads_download, 1)
+        if self._download_executor_size != num_threads:
+            self._close_download_executor()
+            self._download_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=num_threads, thread_name_prefix=f"{self.name}-download"
+            )
+            self._download_executor_size = num_threads
+
+        return self._download_executor
+
+    def _get_fetch_executor(self):
+        """
+        Get the process pool used for calling
+        fetch_data_from_observatory, if pars.download_pool_type
+        is "process". Otherwise, returns None and any
+        existing process pool is shut down.
+        The pool uses the same number of workers
+        as the download threads.
+        """
+        if self.pars.download_pool_type != "process":
+            self._close_fetch_executor()
+            return None
+
+        num_workers = max(self.pars.num_threads_download, 1)
+        if self._fetch_executor_size != num_workers:
+            self._close_fetch_executor()
+            # do not fork a process that is running download threads
+            self._fetch_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self._fetch_executor_size = num_workers
+
+        return self._fetch_executor
+
+    def _close_fetch_executor(self):
+        """
+        Shut down the fetch process pool, if it exists.
+        """
+        if self._fetch_executor is not None:
+            self._fetch_executor.shutdown(wait=True)
+        self._fetch_executor = None
+        self._fetch_executor_size = None
+
+    def _fetch_data(self, cat_row, fetch_args):
+        """
+        Fetch the data for one source, either by calling
+        fetch_data_from_observatory directly, or by sending
+        it to the process pool (if it was created by the
+        current call to download_all_sources).
+        """
+        executor = self._fetch_executor
+        if executor is None:
+            return self.fetch_data_from_observatory(cat_row, **fetch_args)
+
+        return executor.submit(_fetch_in_process, self, cat_row, fetch_args).result()
+
+    def _close_download_executor(self):
+        """
+        Shut down the download thread pool, if it exists.
+        """
+        if self._download_executor is not None:
+            self._download_executor.shutdown(wait=True)
+        self._download_executor = None
+        self._download_executor_size = None
+
+    def close(self):
+        """
+        Shut down the download thread pool
+        and the fetch process pool, if they exist.
+        New pools will be created if any more data is downloaded.
+        """
+        self._close_download_executor()
+        self._close_fetch_executor()
+
+    def __del__(self):
+        # __init__ may have failed before the pool attributes were set
+        for name in ("_download_executor", "_fetch_executor"):
+            executor = getattr(self, name, None)
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def __getstate__(self):
+        """
+        When sending the observatory to another process
+        (e.g., to fetch data in a process pool),
+        do not include the catalog, the downloaded data,
+        or the thread/process pools.
+        """
+        state = self.__dict__.copy()
+        state["_catalog"] = None
+        state["sources"] = []
+        state["datasets"] = []
+        for name in ("_download_executor", "_fetch_executor"):
+            state[name] = None
+            state[f"{name}_size"] = None
+
+        return state
+
     def _load_passwords(self, filename=None, key=None, **_):
         """
         Load a YAML file with usernames, passwords, etc.
@@ -303,13 +575,12 @@ class VirtualObservatory:
         if os.path.isabs(filename):
             filepath = filename
         else:
-            basepath = os.path.dirname(__file__)
-            filepath = os.path.abspath(os.path.join(basepath, "..", filename))
+            filepath = os.path.join(_BASE_DIR, filename)
 
         # if file doesn't exist, just return with an empty dict
         if os.path.exists(filepath):
-            with open(filepath) as file:
-                self._credentials = yaml.safe_load(file).get(key, {})
+            # copy, so updating the credentials doesn't change the cache
+            self._credentials = dict(_load_credentials_file(filepath).get(key, {}))
 
     def run_analysis(self):
         """
@@ -359,6 +630,9 @@ class VirtualObservatory:
 
         The observatory's pars.download_batch_size parameter controls
         how many sources are stored in memory at a time.
+        Only the most recently loaded sources (and their raw data)
+        are kept in self.sources and self.datasets, and older ones
+        are dropped as new sources are added.
         This is useful for large catalogs, where the data
         for all sources exceeds the available RAM.
 
@@ -395,65 +669,76 @@ class VirtualObservatory:
         """
         cat_length = len(self.catalog)
         start = 0 if start is None else start
-        stop = cat_length if stop is None else stop
+        stop = cat_length if stop is None else min(stop, cat_length)
 
-        self.sources = []
-        self.datasets = []
+        # keep only the last few sources/datasets in memory
+        data_classes = self._get_data_classes()
+        batch_size = max(self.pars.download_batch_size, 1)
+        self.sources = collections.deque(maxlen=batch_size)
+        self.datasets = collections.deque(maxlen=batch_size * len(data_classes))
         num_loaded = 0
 
-        download_batch = max(self.pars.num_threads_download, 1)
+        num_threads = min(self.pars.num_threads_download, stop - start)
 
-        for i in range(start, stop, download_batch):
-
-            if i >= cat_length:
-                break
+        # these are the same for all sources
+        download_pars = self._get_download_pars(fetch_args)
 
-            # if temporary sources/datasets are full,
-            # clear the lists before adding more
-            if len(self.sources) > self.pars.download_batch_size:
-                self.sources = []
-                self.datasets = []
+        # make (or remove) the process pool before starting any threads
+        self._get_fetch_executor()
 
-            num_threads = min(self.pars.num_threads_download, stop - i)
-
-            if num_threads > 1:
-                sources = self._fetch_data_asynchronous(
-                    i, i + num_threads, save, fetch_args, dataset_args
+        if num_threads > 1:
+            sources = self._fetch_data_asynchronous(
+                start, stop, save, fetch_args, dataset_args, download_pars
+            )
+        else:  # single threaded execution
+            sources = (
+                self.check_and_fetch_source(
+                    cat_row,
+                    save,
+                    fetch_args,
+                    dataset_args,
+                    existing_sources=existing_sources,
+                    existing_raw_data=existing_raw_data,
+                    download_pars=download_pars,
                 )
-            else:  # single threaded execution
-                cat_row = self.catalog.get_row(i, "number", "dict")
-                s = self.check_and_fetch_source(cat_row, save, fetch_args, dataset_args)
-                sources = [s]
+                for (
+                    cat_row,
+                    existing_sources,
+                    existing_raw_data,
+                ) in self._iter_catalog_rows(start, stop)
+            )
 
+        for s in sources:
             raw_data = []
-            for s in sources:
-                for dt in self.pars.data_types:
-                    obs_data = None
-                    for data in getattr(s, f"raw_{dt}"):
-                        if data.observatory == self.name:
-                            obs_data = data
-                    if obs_data is not None:
-                        raw_data.append(obs_data)
-                    else:
-                        raise RuntimeError(
-                            "Cannot find data from observatory "
-                            f"{self.name} on source {s.name}"
-                        )
+            for _, _, raw_attr, _ in data_classes:
+                obs_data = None
+                for data in getattr(s, raw_attr):
+                    if data.observatory == self.name:
+                        obs_data = data
+                if obs_data is not None:
+                    raw_data.append(obs_data)
+                else:
+                    raise RuntimeError(
+                        "Cannot find data from observatory "
+                        f"{self.name} on source {s.name}"
+                    )
 
-            # keep a subset of sources/datasets in memory
-            self.sources += sources
-            self.datasets += raw_data
-            num_loaded += len(sources)
+            # the oldest sources/datasets are dropped when these are full
+            self.sources.append(s)
+            self.datasets.extend(raw_data)
+            num_loaded += 1
 
         return num_loaded
 
-    def _fetch_data_asynchronous(self, start, stop, save, fetch_args, dataset_args):
+    def _fetch_data_asynchronous(
+        self, start, stop, save, fetch_args, dataset_args, download_pars=None
+    ):
         """
-        Get data for a few sources, either by loading them
+        Get data for a range of sources, either by loading them
         from disk or by fetching the data online from
         the observatory.
 
-        Each source will be handled by a separate thread.
+        Each source will be handled by a thread from the download pool.
         The following actions occur in each thread:
         (1) check if source and raw data exist in DB
         (2) if not, send a request to the observatory
@@ -463,6 +748,11 @@ class VirtualObservatory:
         Since all these actions are I/O bound,
         it makes sense to bundle them up into threads.
 
+        Up to pars.num_threads_download sources are handled
+        at the same time. Whenever one of them is done,
+        the next source is submitted, so a single slow
+        source does not hold up the rest of the threads.
+
         Parameters
         ----------
         start: int
@@ -478,51 +768,153 @@ class VirtualObservatory:
         dataset_args: dict
             Additional keyword arguments to pass to the
             constructor of raw data objects.
+        download_pars: dict, optional
+            The parameters that affect the download,
+            as given by _get_download_pars().
+            If not given, each thread will calculate them.
 
-        Returns
-        -------
-        sources: list
-            List of Source objects.
+        Yields
+        ------
+        source: Source
+            Each Source object, in the order they are completed.
         """
 
-        num_threads = stop - start
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-            futures = []
-            obstime = self.pars.observation_time
-            for i in range(start, stop):
-                cat_row = self.catalog.get_row(
-                    loc=i, index_type="number", output="dict", obstime=obstime
-                )
-                futures.append(
+        executor = self._get_download_executor()
+        num_threads = self._download_executor_size
+        rows = self._iter_catalog_rows(start, stop)
+        inflight = set()
+
+        while True:
+            # keep all the threads busy
+            for cat_row, existing_sources, existing_raw_data in itertools.islice(
+                rows, num_threads - len(inflight)
+            ):
+                inflight.add(
                     executor.submit(
                         self.check_and_fetch_source,
                         cat_row,
                         save,
                         fetch_args,
                         dataset_args,
+                        existing_sources=existing_sources,
+                        existing_raw_data=existing_raw_data,
+                        download_pars=download_pars,
                     )
                 )
 
-            done, _ = concurrent.futures.wait(
-                futures, return_when=concurrent.futures.ALL_COMPLETED
+            if len(inflight) == 0:
+                break
+
+            done, inflight = concurrent.futures.wait(
+                inflight, return_when=concurrent.futures.FIRST_COMPLETED
             )
 
-        sources = []
-        for future in done:
-            source = future.result()
-            if isinstance(source, Exception):
-                raise source
-            if not isinstance(source, Source):
-                raise RuntimeError(
-                    f"Source is not a Source object, but a {type(source)}. "
-                )
-            sources.append(source)
+            for future in done:
+                source = future.result()
+                if isinstance(source, Exception):
+                    raise source
+                if not isinstance(source, Source):
+                    raise RuntimeError(
+                        f"Source is not a Source object, but a {type(source)}. "
+                    )
+                yield source
+
+    def _iter_catalog_rows(self, start, stop):
+        """
+        Go over the catalog rows in the given range,
+        along with the sources and raw data that already
+        exist in the database.
+        The sources are loaded in blocks of pars.download_batch_size
+        catalog rows, using a single query for each block
+        (and one query per data type for the raw data),
+        instead of querying the database once per source.
+
+        Parameters
+        ----------
+        start: int
+            Catalog index of first source.
+        stop: int
+            Catalog index of last source.
+
+        Yields
+        ------
+        cat_row: dict
+            A row in the catalog.
+        existing_sources: dict
+            Sources loaded from the database for the current block,
+            keyed by source name. Sources not in the database
+            are not included.
+        existing_raw_data: dict
+            Raw data objects from this observatory, loaded from
+            the database for the current block, keyed by
+            (data_type, source_name). This includes raw data
+            that is not associated with any of the sources.
+        """
+        obstime = self.pars.observation_time
+        block_size = max(self.pars.download_batch_size, 1)
+        data_classes = self._get_data_classes()
+
+        for block_start in range(start, stop, block_size):
+            cat_rows = self.catalog.get_rows(
+                block_start, min(block_start + block_size, stop), obstime=obstime
+            )
+
+            existing_sources = {}
+            existing_raw_data = {}
+            with Session() as session:
+                names = [cat_row["name"] for cat_row in cat_rows]
+                for source in session.scalars(
+                    sa.select(Source).where(Source.name.in_(names))
+                ):  # TODO: add cfg_hash
+                    existing_sources.setdefault(source.name, source)
+
+                for dt, data_class, _, _ in data_classes:
+                    for raw_data in session.scalars(
+                        sa.select(data_class).where(
+                            data_class.source_name.in_(names),
+                            data_class.observatory == self.name,
+                        )
+                    ):
+                        existing_raw_data.setdefault(
+                            (dt, raw_data.source_name), raw_data
+                        )
 
-        return sources
+            for cat_row in cat_rows:
+                yield cat_row, existing_sources, existing_raw_data
+
+    def _get_download_pars(self, fetch_args={}):
+        """
+        Get the values of the parameters that affect the download
+        (the keys in pars.download_pars_list), taken from the
+        parameters object, or from fetch_args if they are given there.
+
+        Parameters
+        ----------
+        fetch_args: dict
+            Additional keyword arguments to pass to the
+            fetch_data_from_observatory method.
+
+        Returns
+        -------
+        dict
+            The download parameters and their values.
+        """
+        download_pars = {k: self.pars[k] for k in self.pars.download_pars_list}
+        download_pars.update(
+            {k: fetch_args[k] for k in self.pars.download_pars_list if k in fetch_args}
+        )
+
+        return download_pars
 
     def check_and_fetch_source(
-        self, cat_row, save=True, fetch_args={}, dataset_args={}
+        self,
+        cat_row,
+        save=True,
+        fetch_args={},
+        dataset_args={},
+        existing_sources=None,
+        existing_raw_data=None,
+        download_pars=None,
     ):
         """
         Check if a source exists in the database,
@@ -543,6 +935,21 @@ class VirtualObservatory:
         dataset_args: dict
             Additional keyword arguments to pass to the
             constructor of raw data objects.
+        existing_sources: dict, optional
+            Sources that were already loaded from the database,
+            keyed by source name (e.g., using _iter_catalog_rows).
+            If given, the source is taken from this dictionary
+            (or created if it is not there) instead of
+            querying the database.
+        existing_raw_data: dict, optional
+            Raw data objects that were already loaded from the database,
+            keyed by (data_type, source_name) (e.g., using _iter_catalog_rows).
+            If given, raw data that is not attached to the source
+            is taken from this dictionary instead of querying the database.
+        download_pars: dict, optional
+            The parameters that affect the download,
+            as given by _get_download_pars(fetch_args).
+            If not given, they are calculated for this source.
 
         Returns
         -------
@@ -554,171 +961,237 @@ class VirtualObservatory:
 
         """
 
-        download_pars = {k: self.pars[k] for k in self.pars.download_pars_list}
-        download_pars.update(
-            {k: fetch_args[k] for k in self.pars.download_pars_list if k in fetch_args}
-        )
+        if download_pars is None:
+            download_pars = self._get_download_pars(fetch_args)
+
+        # read the parameters once, outside the loops
+        pars = self.pars
+        obs_name = self.name
+        check_download_pars = pars.check_download_pars
+        download_pars_list = pars.download_pars_list
+        data_classes = self._get_data_classes()
 
         with Session() as session:
-            source = session.scalars(
-                sa.select(Source).where(
-                    Source.name == cat_row["name"]
-                )  # TODO: add cfg_hash
-            ).first()
+            if existing_sources is None:
+                source = session.scalars(
+                    sa.select(Source).where(
+                        Source.name == cat_row["name"]
+                    )  # TODO: add cfg_hash
+                ).first()
+            else:
+                source = existing_sources.get(cat_row["name"])
+                if source is not None:
+                    session.add(source)  # attach to this thread's session
             if source is None:
                 source = Source(**cat_row, project=self.project)  # TODO: add cfg_hash
                 source.cat_row = cat_row  # save the raw catalog row as well
 
-            new_data = []
-            for dt in self.pars.data_types:
-                data_class = get_class_from_data_type(dt)
-                # if source existed in DB it should have raw data objects
-                # if it doesn't that means the data needs to be downloaded
-                raw_data = source.get_raw_data(
-                    obs=self.name, data_type=dt, session=session
-                )
-
-                if raw_data is not None and not raw_data.check_file_exists():
-                    # session.delete(raw_data)
-                    # raw_data = None
-                    raise RuntimeError(
-                        f"{data_class} object for source {source.name} "
-                        "exists in DB but file does not exist."
-                    )
-
-                # file exists, try to load it:
-                if raw_data is not None:
-                    lock.acquire()
-                    try:
-                        raw_data.load()
-                    except KeyError as e:
-                        if "No object named" in str(e):
-                            # This does not exist in the file
+                # here we explicitly set all relational collections
+                # to an empty list, so they are accessible (and empty)
+                # even if the source is no longer attached to the DB.
+                # (sources from the DB already have them loaded)
+                for _, _, _, other_attrs in data_classes:
+                    for attr in other_attrs:
+                        setattr(source, attr, [])
+                source.detections = []
+                # add more collections here...
 
-                            # TODO: is delete the right thing to do?
-                            source.remove_raw_data(
-                                obs=self.name, data_type=dt, session=session
-                            )
-                            session.flush()
-                            raw_data = None
-                        else:
-                            raise e
-                    finally:
-                        lock.release()
-
-                if raw_data is not None and self.pars.check_download_pars:
-                    # check if the download parameters used to save
-                    # the data are consistent with those used now
-                    if "download_pars" not in raw_data.altdata:
-                        # TODO: is delete the right thing to do?
-                        source.remove_raw_data(
-                            obs=self.name, data_type=dt, session=session
+            # first check which datasets are already on DB/disk,
+            # and remove the ones that cannot be used anymore
+            existing_data = []
+            removed_data = False
+            # do not flush on every query/removal inside the loop
+            with session.no_autoflush:
+                for dt, data_class, _, _ in data_classes:
+                    # if source existed in DB it should have raw data objects
+                    # if it doesn't that means the data needs to be downloaded
+                    if existing_raw_data is None:
+                        raw_data = source.get_raw_data(
+                            obs=obs_name, data_type=dt, session=session
                         )
-                        session.flush()
-                        raw_data = None
                     else:
-                        for key in self.pars.download_pars_list:
-                            if (
-                                key not in raw_data.altdata["download_pars"]
-                                or raw_data.altdata["download_pars"][key]
-                                != download_pars[key]
-                            ):
+                        raw_data = source.get_raw_data(obs=obs_name, data_type=dt)
+                        if raw_data is None:
+                            raw_data = existing_raw_data.get((dt, source.name))
+                            if raw_data is not None:
+                                session.add(raw_data)  # attach to this session
+
+                    if raw_data is not None and not raw_data.check_file_exists():
+                        # session.delete(raw_data)
+                        # raw_data = None
+                        raise RuntimeError(
+                            f"{data_class} object for source {source.name} "
+                            "exists in DB but file does not exist."
+                        )
+
+                    # file exists, try to load it:
+                    if raw_data is not None:
+                        with _get_file_lock(raw_data.get_fullname()):
+                            try:
+                                raw_data.load()
+                            except DatasetNotInFile:
+                                # This does not exist in the file
+
                                 # TODO: is delete the right thing to do?
                                 source.remove_raw_data(
-                                    obs=self.name, data_type=dt, session=session
+                                    obs=obs_name, data_type=dt, session=session
                                 )
-                                session.flush()
+                                removed_data = True
                                 raw_data = None
-                                break
-
-                # no data on DB/file, must re-fetch from observatory website:
-                if raw_data is None:
-                    # <-- magic happens here! -- >
-                    data, altdata = self.fetch_data_from_observatory(
-                        cat_row, **fetch_args
-                    )
-
-                    # save the catalog info
-                    # TODO: should we get the full catalog row?
-                    altdata["cat_row"] = cat_row
 
-                    # save the parameters involved with the download
-                    altdata["download_pars"] = download_pars
-
-                    raw_data = data_class(
-                        data=data,
-                        altdata=altdata,
-                        observatory=self.name,
-                        source_name=cat_row["name"],
-                        **dataset_args,
-                    )
-                    # keep track of new dataset that need
-                    # to be saved to disk and DB
-                    new_data.append(raw_data)
+                    if raw_data is not None and check_download_pars:
+                        # check if the download parameters used to save
+                        # the data are consistent with those used now
+                        if "download_pars" not in raw_data.altdata:
+                            # TODO: is delete the right thing to do?
+                            source.remove_raw_data(
+                                obs=obs_name, data_type=dt, session=session
+                            )
+                            removed_data = True
+                            raw_data = None
+                        else:
+                            for key in download_pars_list:
+                                if (
+                                    key not in raw_data.altdata["download_pars"]
+                                    or raw_data.altdata["download_pars"][key]
+                                    != download_pars[key]
+                                ):
+                                    # TODO: is delete the right thing to do?
+                                    source.remove_raw_data(
+                                        obs=obs_name, data_type=dt, session=session
+                                    )
+                                    removed_data = True
+                                    raw_data = None
+                                    break
+
+                    existing_data.append(raw_data)
+
+            # the deletions must reach the DB before any
+            # replacement datasets are added to the source
+            if removed_data:
+                session.flush()
 
-                # this dataset is not appended to source yet:
-                if not any(
-                    [r.observatory == self.name for r in getattr(source, f"raw_{dt}")]
+            new_data = []
+            with session.no_autoflush:
+                for (dt, data_class, raw_attr, _), raw_data in zip(
+                    data_classes, existing_data
                 ):
-                    getattr(source, f"raw_{dt}").append(raw_data)
+                    # no data on DB/file, must re-fetch from observatory website:
+                    if raw_data is None:
+                        # <-- magic happens here! -- >
+                        data, altdata = self._fetch_data(cat_row, fetch_args)
+
+                        # save the catalog info
+                        # TODO: should we get the full catalog row?
+                        altdata["cat_row"] = cat_row
+
+                        # save the parameters involved with the download
+                        altdata["download_pars"] = download_pars
+
+                        raw_data = data_class(
+                            data=data,
+                            altdata=altdata,
+                            observatory=obs_name,
+                            source_name=cat_row["name"],
+                            **dataset_args,
+                        )
+                        # keep track of new dataset that need
+                        # to be saved to disk and DB
+                        new_data.append(raw_data)
 
-                # here we explicitly set all relational collections
-                # to an empty list, so they are accessible (and empty)
-                # even if the source is no longer attached to the DB.
-                for name in ["reduced", "processed", "simulated"]:
-                    if len(getattr(source, f"{name}_{dt}")) == 0:
-                        setattr(source, f"{name}_{dt}", [])
-                if len(source.detections) == 0:
-                    source.detections = []
-                # add more collections here...
+                    # this dataset is not appended to source yet:
+                    raw_list = getattr(source, raw_attr)
+                    if not any(r.observatory == obs_name for r in raw_list):
+                        raw_list.append(raw_data)
 
             # unless debugging, you'd want to save this data
             if save:
-                if source.ra is not None:
-                    ra = source.ra
-                    ra_deg = np.floor(ra)
-                    if self.pars.save_ra_minutes:
-                        ra_minute = np.floor((ra - ra_deg) * 60)
-                    else:
-                        ra_minute = None
-                    if self.pars.save_ra_seconds:
-                        ra_second = np.floor((ra - ra_deg - ra_minute / 60) * 3600)
-                    else:
-                        ra_second = None
-                else:
-                    ra_deg = None
-                    ra_minute = None
-                    ra_second = None
-
-                try:
-                    session.add(source)
-                    # try to save the data to disk
-                    lock.acquire()  # thread blocks at this line until it can obtain lock
-                    try:
-                        for data in new_data:
-                            data.save(
-                                overwrite=self.pars.overwrite_files,
-                                source_name=source.name,
-                                ra_deg=ra_deg,
-                                ra_minute=ra_minute,
-                                ra_second=ra_second,
-                                key_prefix=self.pars.filekey_prefix,
-                                key_suffix=self.pars.filekey_suffix,
-                            )
-                    finally:
-                        lock.release()
-                    # try to save the source+data to the database
-                    session.commit()
-                except Exception:
-                    session.rollback()
-                    # if saving to disk or database fails,
-                    # make sure we do not leave orphans
-                    for data in new_data:
-                        data.delete_data_from_disk()
-                    raise
+                self._save_source(session, source, new_data)
 
         return source
 
+    def _save_source(self, session, source, new_data):
+        """
+        Save any newly fetched raw data to disk,
+        and then commit the source and its raw data
+        to the database.
+        If saving fails, the files of the new data
+        are removed, so no orphans are left on disk.
+
+        This is the last step of check_and_fetch_source,
+        and is kept separate from fetching the data,
+        so each of these stages can be called on its own.
+
+        Parameters
+        ----------
+        session: sqlalchemy.orm.Session
+            The session used to load (or create) the source.
+        source: Source
+            The source to save to the database.
+        new_data: list of raw data objects
+            Datasets that were fetched from the observatory
+            and still need to be saved to disk.
+        """
+        pars = self.pars
+        save_ra_minutes = pars.save_ra_minutes
+        save_ra_seconds = pars.save_ra_seconds
+        overwrite = pars.overwrite_files
+        key_prefix = pars.filekey_prefix
+        key_suffix = pars.filekey_suffix
+
+        if source.ra is not None:
+            # plain python math is much faster than
+            # numpy functions when used on scalars
+            ra = source.ra
+            ra_deg = math.floor(ra)
+            minutes = math.floor((ra - ra_deg) * 60)
+            # seconds are only saved in addition to minutes
+            if save_ra_minutes or save_ra_seconds:
+                ra_minute = minutes
+            else:
+                ra_minute = None
+            if save_ra_seconds:
+                ra_second = math.floor((ra - ra_deg - minutes / 60) * 3600)
+            else:
+                ra_second = None
+        else:
+            ra_deg = None
+            ra_minute = None
+            ra_second = None
+
+        try:
+            session.add(source)
+            # try to save the data to disk
+            for data in new_data:
+                # need the filename to know which file to lock
+                if data.filename is None:
+                    data.invent_filename(
+                        source_name=source.name,
+                        ra_deg=ra_deg,
+                        ra_minute=ra_minute,
+                        ra_second=ra_second,
+                    )
+                # thread blocks here until no other thread uses this file
+                with _get_file_lock(data.get_fullname()):
+                    data.save(
+                        overwrite=overwrite,
+                        source_name=source.name,
+                        ra_deg=ra_deg,
+                        ra_minute=ra_minute,
+                        ra_second=ra_second,
+                        key_prefix=key_prefix,
+                        key_suffix=key_suffix,
+                    )
+            # try to save the source+data to the database
+            session.commit()
+        except Exception:
+            session.rollback()
+            # if saving to disk or database fails,
+            # make sure we do not leave orphans
+            for data in new_data:
+                data.delete_data_from_disk()
+            raise
+
     def fetch_data_from_observatory(self, cat_row, **kwargs):
         """
         Fetch data from the observatory for a given source.
@@ -769,10 +1242,16 @@ class VirtualObservatory:
             each file. Zero or None (default) means
             all sources found in each file.
 
+        New sources are committed to the database in batches
+        of pars.commit_batch_size sources.
         """
-        if self.pars.catalog_matching == "number":
+        # read the parameters once, outside the loops
+        pars = self.pars
+        verbose = pars.verbose
+
+        if pars.catalog_matching == "number":
             column = "cat_index"
-        elif self.pars.catalog_matching == "name":
+        elif pars.catalog_matching == "name":
             column = "cat_id"
         else:
             raise ValueError("catalog_matching must be either 'number' or 'name'")
@@ -780,34 +1259,63 @@ class VirtualObservatory:
         # get a list of existing sources and their ID
         source_ids = get_source_identifiers(self.project, column)
 
-        dir = self.pars.get_data_path()
-        if self.pars.verbose:
+        dir = pars.get_data_path()
+        if verbose:
             print(f"Reading from data folder: {dir}")
 
+        batch_size = max(pars.commit_batch_size, 1)
+        num_added = 0  # new sources since the last commit
+
+        # when the identifier is in the key, we can skip
+        # existing sources without reading their data
+        id_from_key = pars.dataset_identifier == "key"
+
         with Session() as session:
-            for i, filename in enumerate(glob.glob(os.path.join(dir, files_glob))):
+            # iglob yields the files lazily, so we never list
+            # more files than are needed when num_files is given
+            for i, filename in enumerate(glob.iglob(os.path.join(dir, files_glob))):
                 if num_files and i >= num_files:
                     break
 
-                if self.pars.verbose:
+                if verbose:
                     print(f"Reading filename: {filename}")
                 # TODO: add if-else for different file types
                 with pd.HDFStore(filename) as store:
-                    keys = store.keys()
-                    for j, k in enumerate(keys):
-                        if num_sources and j >= num_sources:
-                            break
-                        data = store[k]
-                        cat_id = self._find_dataset_identifier(data, k)
+                    keys = _iter_store_keys(store)
+                    if num_sources:
+                        keys = itertools.islice(keys, num_sources)
+                    for k in keys:
+                        if id_from_key:
+                            cat_id = self._find_dataset_identifier(None, k)
+                            if cat_id in source_ids:
+                                continue  # source already exists
+                            data = store[k]
+                        else:
+                            data = store[k]
+                            cat_id = self._find_dataset_identifier(data, k)
                         data_type = (
                             "photometry"  # TODO: what about multiple data types??
                         )
                         # TODO: maybe just infer the data type from the filename?
-                        self.commit_source(
-                            data, data_type, cat_id, source_ids, filename, k, session
+                        num_added += self.commit_source(
+                            data,
+                            data_type,
+                            cat_id,
+                            source_ids,
+                            filename,
+                            k,
+                            session,
                         )
+                        # send the new sources to the DB in batches
+                        if num_added >= batch_size:
+                            session.commit()
+                            num_added = 0
+
+            # commit whatever is left from the last batch
+            if num_added > 0:
+                session.commit()
 
-        if self.pars.verbose:
+        if verbose:
             print("Done populating sources.")
 
     def _find_dataset_identifier(self, data, key):
@@ -836,30 +1344,34 @@ class VirtualObservatory:
             If it is 'number', this would be an integer
             (the index of the source in the catalog).
         """
-        if self.pars.dataset_identifier == "attribute":
-            if "dataset_attribute" not in self.pars:
+        pars = self.pars
+        identifier = pars.dataset_identifier
+        matching = pars.catalog_matching
+
+        if identifier == "attribute":
+            if "dataset_attribute" not in pars:
                 raise ValueError(
                     "When using dataset_identifier='attribute', "
                     "you must specify the dataset_attribute, "
                     "that is the name of the attribute "
                     "that contains the identifier."
                 )
-            value = getattr(data, self.pars.dataset_attribute)
-        elif self.pars.dataset_identifier == "key":
-            if self.pars.catalog_matching == "number":
-                value = int(re.search(r"\d+", key).group())
-            elif self.pars.catalog_matching == "name":
+            value = getattr(data, pars.dataset_attribute)
+        elif identifier == "key":
+            if matching == "number":
+                value = _number_from_key(key)
+            elif matching == "name":
                 value = key
         else:
             raise ValueError('dataset_identifier must be "attribute" or "key"')
 
-        if self.pars.catalog_matching == "number":
+        if matching == "number":
             value = int(value)
 
         return value
 
     def commit_source(
-        self, data, data_type, cat_id, source_ids, filename, key, session
+        self, data, data_type, cat_id, source_ids, filename, key, session, commit=False
     ):
         """
         Save a source to the database,
@@ -894,22 +1406,36 @@ class VirtualObservatory:
         session: sqlalchemy.orm.session.Session
             The current session to which we add
             newly created sources.
+        commit: bool
+            If True, commit the session after adding the new source.
+            If False (default), the new source is only added to
+            the session, so many sources can be committed together
+            by the caller (see populate_sources).
 
+        Returns
+        -------
+        bool
+            True if a new source was added to the session,
+            False if the data was empty or the source already exists.
         """
-        if self.pars.verbose > 1:
+        pars = self.pars
+        exists = cat_id in source_ids
+
+        if pars.verbose > 1:
             print(
                 f"Loaded data for source {cat_id} | "
                 f"len(data): {len(data)} | "
-                f"id in source_ids: {cat_id in source_ids}"
+                f"id in source_ids: {exists}"
             )
 
-        if len(data) <= 0:
-            return  # no data
+        if exists:
+            return False  # source already exists
 
-        if cat_id in source_ids:
-            return  # source already exists
+        if len(data) <= 0:
+            return False  # no data
 
-        row = self.catalog.get_row(cat_id, self.pars.catalog_matching)
+        catalog = self.catalog
+        row = catalog.get_row(cat_id, pars.catalog_matching)
 
         (
             index,
@@ -920,7 +1446,7 @@ class VirtualObservatory:
             mag_err,
             filter_name,
             alias,
-        ) = self.catalog.values_from_row(row)
+        ) = catalog.values_from_row(row)
 
         new_source = Source(
             name=name,
@@ -934,7 +1460,7 @@ class VirtualObservatory:
         )
         new_source.cat_id = name
         new_source.cat_index = index
-        new_source.cat_name = self.catalog.pars.catalog_name
+        new_source.cat_name = catalog.pars.catalog_name
 
         data_class = get_class_from_data_type(data_type)
         raw_data = data_class(
@@ -945,16 +1471,19 @@ class VirtualObservatory:
         )
 
         setattr(new_source, f"raw_{data_type}", [raw_data])
-        setattr(new_source, f"reduced_{data_type}", self.reduce(new_source))
-        for d in getattr(new_source, f"reduced_{data_type}"):
-            d.save()
+        reduced_data = self.reduce(new_source)
+        setattr(new_source, f"reduced_{data_type}", reduced_data)
+        DatasetMixin.save_many(reduced_data)
 
         session.add(new_source)
-        session.commit()
+        if commit:
+            session.commit()
         source_ids.add(cat_id)
 
         # TODO: is here the point where we also do analysis?
 
+        return True
+
     def reduce(self, source, data_type=None, output_type=None, **kwargs):
         """
         Reduce raw data into more useful,
@@ -1020,9 +1549,10 @@ class VirtualObservatory:
         # parameters for the reduction
         # are taken from the config first,
         # then from the user inputs
-        if "reducer" in self.pars and isinstance(self.pars.reducer, dict):
+        pars = self.pars
+        if "reducer" in pars and isinstance(pars.reducer, dict):
             parameters = {}
-            parameters.update(self.pars.reducer)
+            parameters.update(pars.reducer)
             parameters.update(kwargs)
             kwargs = parameters
 
@@ -1042,10 +1572,7 @@ class VirtualObservatory:
             reducer_name = f"reduce_{data_type}_to_{output_type}"
 
         # get the reducer function
-        if hasattr(self, reducer_name):
-            reducer = getattr(self, reducer_name)
-        else:
-            reducer = None
+        reducer = getattr(self, reducer_name, None)
 
         # check the reducer function is legit
         if reducer is None or not callable(reducer):
@@ -1053,26 +1580,25 @@ class VirtualObservatory:
 
         # TODO: should we allow using source=None?
         new_datasets = reducer(dataset, source, init_kwargs, **kwargs)
-        new_datasets = sorted(new_datasets, key=lambda x: x.time_start)
-
-        # copy some properties of the observatory into the new datasets
-        copy_attrs = ["project", "cfg_hash"]
-        for d in new_datasets:
-            for attr in copy_attrs:
-                setattr(d, attr, getattr(self, attr))
-
-        # make sure each reduced dataset is associated with a source
-        for d in new_datasets:
+        if len(new_datasets) > 1:
+            # the reducer returns a new list, so it can be sorted in place
+            new_datasets.sort(key=operator.attrgetter("time_start"))
+
+        # copy some properties of the observatory into the new datasets,
+        # make sure each one is associated with a source,
+        # and that each one has a serial number (all in one pass)
+        project, cfg_hash = self.project, self.cfg_hash
+        total = len(new_datasets)
+        for i, d in enumerate(new_datasets):
+            d.project = project
+            d.cfg_hash = cfg_hash
             d.source = source
+            d.reduction_number = i + 1
+            d.reduction_total = total
 
         if source is not None:
-            old_datasets = getattr(source, f"reduced_{output_type}")
-            setattr(source, f"reduced_{output_type}", old_datasets + new_datasets)
-
-        # make sure each reduced dataset has a serial number:
-        for i, d in enumerate(new_datasets):
-            d.reduction_number = i + 1
-            d.reduction_total = len(new_datasets)
+            # add the new datasets to the existing list, in place
+            getattr(source, f"reduced_{output_type}").extend(new_datasets)
 
         return new_datasets
 
@@ -1096,8 +1622,9 @@ class VirtualObservatory:
         # arguments to be passed into the new dataset constructors
         init_kwargs = {}
         for att in DatasetMixin.default_copy_attributes:
-            if hasattr(dataset, att):
-                init_kwargs[att] = getattr(dataset, att)
+            value = getattr(dataset, att, _MISSING)
+            if value is not _MISSING:
+                init_kwargs[att] = value
 
         # TODO: What if dataset has not been committed yet and has no id?
         init_kwargs["raw_data_id"] = dataset.id
@@ -1108,12 +1635,9 @@ class VirtualObservatory:
             init_kwargs["raw_data_filename"] = dataset.filename
 
         for att in DatasetMixin.default_update_attributes:
-            new_dict = {}
             new_value = getattr(dataset, att)
-            if isinstance(new_value, dict):
-                new_dict.update(new_value)
-            if len(new_dict) > 0:
-                init_kwargs[att] = new_dict
+            if isinstance(new_value, dict) and len(new_value) > 0:
+                init_kwargs[att] = dict(new_value)
 
         init_kwargs["filtmap"] = self.pars.filtmap
 
@@ -1178,6 +1702,9 @@ class ParsDemoObs(ParsObservatory):
         the demo_url is a valid URL.
         """
         if key == "demo_url":
+            # only the demo observatory needs this package
+            import validators
+
             validators.url(value)
 
         super().__setattr__(key, value)
@@ -1212,6 +1739,20 @@ class VirtualDemoObs(VirtualObservatory):
         # call this only after a pars object is set up
         super().__init__(name="demo")
 
+        # random number generator for simulating the data
+        self._rng = np.random.default_rng()
+
+    def __getstate__(self):
+        """
+        Each copy of the observatory sent to another process
+        gets a new random number generator, otherwise all copies
+        would simulate exactly the same data.
+        """
+        state = super().__getstate__()
+        state["_rng"] = np.random.default_rng()
+
+        return state
+
     def fetch_data_from_observatory(
         self,
         cat_row,
@@ -1263,24 +1804,28 @@ class VirtualDemoObs(VirtualObservatory):
             wait_time = self.pars.wait_time
         if wait_time_poisson is None:
             wait_time_poisson = self.pars.wait_time_poisson
+        # make a new dict, so we don't change the original dict in pars
+        # (simulate_lightcurve does not modify the values themselves)
         if sim_args is not None:
-            # need a copy, so we don't change the original dict in pars:
-            sim_args_default = copy.deepcopy(self.pars.sim_args)
-            sim_args_default.update(sim_args)
-            sim_args = sim_args_default
+            sim_args = {**self.pars.sim_args, **sim_args}
+        else:
+            sim_args = dict(self.pars.sim_args)
 
         if verbose:
             print(
                 f'Fetching data from demo observatory for source {cat_row["cat_index"]}'
             )
-        total_wait_time_seconds = wait_time + np.random.poisson(wait_time_poisson)
-        data = self.simulate_lightcurve(**sim_args)
+        total_wait_time_seconds = wait_time
+        if wait_time_poisson > 0:
+            total_wait_time_seconds += self._rng.poisson(wait_time_poisson)
+        data = self.simulate_lightcurve(**sim_args, rng=self._rng)
         altdata = {
             "demo_boolean": self.pars.demo_boolean,
             "wait_time": total_wait_time_seconds,
         }
 
-        time.sleep(total_wait_time_seconds)
+        if total_wait_time_seconds > 0:  # no need to yield the thread otherwise
+            time.sleep(total_wait_time_seconds)
 
         if verbose:
             print(
@@ -1299,20 +1844,32 @@ class VirtualDemoObs(VirtualObservatory):
         mean_mag=18,
         exptime=30,
         filter="R",
+        rng=None,
     ):
+        if rng is None:
+            rng = np.random.default_rng()
+
         if shuffle_time:
-            mjd = np.random.uniform(mjd_range[0], mjd_range[1], num_points)
+            mjd = rng.uniform(mjd_range[0], mjd_range[1], num_points)
         else:
             mjd = np.linspace(mjd_range[0], mjd_range[1], num_points)
 
-        mag_err = np.random.uniform(mag_err_range[0], mag_err_range[1], num_points)
-        mag = np.random.normal(mean_mag, mag_err, num_points)
+        mag_err = rng.uniform(mag_err_range[0], mag_err_range[1], num_points)
+        mag = rng.normal(mean_mag, mag_err, num_points)
         flag = np.zeros(num_points, dtype=bool)
-        test_data = dict(mjd=mjd, mag=mag, mag_err=mag_err, filter=filter, flag=flag)
-        df = pd.DataFrame(test_data)
-        df["exptime"] = exptime
 
-        return df
+        # make all columns at once (scalars are broadcast to all rows),
+        # adding a column afterwards makes pandas copy the data again
+        test_data = dict(
+            mjd=mjd,
+            mag=mag,
+            mag_err=mag_err,
+            filter=filter,
+            flag=flag,
+            exptime=exptime,
+        )
+
+        return pd.DataFrame(test_data)
 
     def reduce_photometry(
         self, dataset, source=None, init_kwargs={}, mag_range=None, drop_bad=False, **_
@@ -1367,7 +1924,7 @@ class VirtualDemoObs(VirtualObservatory):
 
         # check the source magnitude is within the range
         if source and source.mag is not None and mag_range:
-            mag = dataset.data[dataset.mag_col]
+            mag = dataset.data[dataset.mag_col].to_numpy()
             mag_mx = source.mag + mag_range
             mag_mn = source.mag - mag_range
             if not mag_mn < np.nanmedian(mag) < mag_mx:
@@ -1378,18 +1935,24 @@ class VirtualDemoObs(VirtualObservatory):
             # make sure there is some photometric data available
             filt_col = dataset.colmap["filter"]
             flag_col = dataset.colmap["flag"] if "flag" in dataset.colmap else None
-            filters = dataset.data[filt_col].unique()
-            dfs = []
-            for f in filters:
-                # new dataframe for each filter, each one with a new index
-                df_new = dataset.data.loc[dataset.data[filt_col] == f, :].copy()
-                df_new.reset_index(drop=True)
-
-                if drop_bad and flag_col is not None:
-                    df_new = df_new[df_new[flag_col] == 0]
-
-                dfs.append(df_new)
-                # TODO: what happens if filter is in altdata, not in dataframe?
+            data = dataset.data
+            if drop_bad and flag_col is not None:
+                # remove bad points from all filters at once
+                data = data[data[flag_col].to_numpy() == 0]
+
+            # read the filter column only once
+            filters = data[filt_col].to_numpy()
+            if len(filters) > 0 and (filters == filters[0]).all():
+                # only one filter: no need to split the data
+                dfs = [data.reset_index(drop=True)]
+            else:
+                dfs = []
+                # split all filters in one pass (in order of appearance),
+                # instead of scanning the whole dataframe for each filter
+                for _, df_new in data.groupby(filt_col, sort=False):
+                    # new dataframe for each filter, each one with a new index
+                    dfs.append(df_new.reset_index(drop=True))
+            # TODO: what happens if filter is in altdata, not in dataframe?
 
             new_datasets = []
             for df in dfs:
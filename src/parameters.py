@@ -1,5 +1,7 @@
 import os
 import copy
+import functools
+import importlib
 import yaml
 
 from src.database import DATA_ROOT
@@ -9,8 +11,14 @@ from src.database import DATA_ROOT
 # Each time load() is called with the same
 # filename but different key, it will not
 # need to re-read the file from disk.
+# Each file is kept along with its modification time,
+# so it is read again only if it has changed.
 LOADED_FILES = {}
 
+# use the (much faster) libyaml parser/emitter, if PyYAML was built with it
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
 
 # TODO: use typing module to specify types and Annotated for descriptions
 # ref: https://stackoverflow.com/a/8820636/18256949
@@ -25,6 +33,18 @@ propagated_keys = ["data_types", "project", "cfg_file", "verbose"]
 # possible values for the data_types parameter
 allowed_data_types = ["photometry", "spectra", "images"]
 
+# map each (lower case) alias of a data type to its canonical name
+_data_type_aliases = {
+    alias: name
+    for name, aliases in {
+        "photometry": ["photometry", "phot", "lightcurve", "lightcurves", "lc", "lcs"],
+        "spectra": ["spectra", "spec", "spectrum", "sed", "seds"],
+        "images": ["images", "image", "im", "img", "imgs"],
+        "cutouts": ["cutout", "cutouts", "thumbnail", "thumbnails"],
+    }.items()
+    for alias in aliases
+}
+
 
 def convert_data_type(data_type):
     """
@@ -43,22 +63,8 @@ def convert_data_type(data_type):
         The canonical name of the data type.
         Will be one of the allowed_data_types.
     """
-    if data_type.lower() in [
-        "photometry",
-        "phot",
-        "lightcurve",
-        "lightcurves",
-        "lc",
-        "lcs",
-    ]:
-        out_type = "photometry"
-    elif data_type.lower() in ["spectra", "spec", "spectrum", "spectra", "sed", "seds"]:
-        out_type = "spectra"
-    elif data_type.lower() in ["images", "image", "im", "img", "imgs"]:
-        out_type = "images"
-    elif data_type.lower() in ["cutout", "cutouts", "thumbnail", "thumbnails"]:
-        out_type = "cutouts"
-    else:
+    out_type = _data_type_aliases.get(data_type.lower())
+    if out_type is None:
         raise ValueError(
             f'Data type given "{data_type}" ' f"is not one of {allowed_data_types}"
         )
@@ -80,7 +86,63 @@ def normalize_data_types(data_types):
     """
     if isinstance(data_types, str):
         return [convert_data_type(data_types)]
-    return sorted(convert_data_type(dt) for dt in data_types)
+    # return a new list, so the cached tuple cannot be modified
+    return list(_normalize_data_types_tuple(tuple(data_types)))
+
+
+@functools.lru_cache(maxsize=64)
+def _normalize_data_types_tuple(data_types):
+    """
+    Cached version of normalize_data_types for a tuple
+    of strings, which returns a sorted tuple.
+    The same few lists of data types are normalized
+    every time a parameters object is created.
+    """
+    return tuple(sorted(convert_data_type(dt) for dt in data_types))
+
+
+# marks parameters that are not defined on an object
+# (None could be a legitimate value of the parameter)
+_MISSING = object()
+
+
+def _merge_dicts(target, source):
+    """
+    Update the target dictionary with the values in source.
+    Dictionaries that appear in both are merged recursively
+    (into a copy, so nested dictionaries that may be shared
+    with other objects, e.g., loaded config files, are not changed).
+    Returns the target dictionary.
+    """
+    for key, value in source.items():
+        current = target.get(key)
+        if isinstance(current, dict) and isinstance(value, dict):
+            target[key] = _merge_dicts(dict(current), value)
+        else:
+            target[key] = value
+
+    return target
+
+
+# default module and class names for the core classes
+# that can be loaded using get_class_instance()
+_core_classes = {
+    "analysis": ("src.analysis", "Analysis"),
+    "simulator": ("src.simulator", "Simulator"),
+    "catalog": ("src.catalog", "Catalog"),
+    "finder": ("src.finder", "Finder"),
+    "quality": ("src.quality", "Quality"),
+    "histogram": ("src.histogram", "Histogram"),
+}
+
+
+@functools.lru_cache(maxsize=64)
+def _import_class(module, class_name):
+    """
+    Import a module and get the class with the given name from it.
+    The result is cached, so each class is only looked up once.
+    """
+    return getattr(importlib.import_module(module), class_name)
 
 
 def get_class_from_data_type(data_type):
@@ -430,7 +492,9 @@ class Parameters:
             if key is not None:
                 config = config.get(key, {})
 
-            return config
+            # the caller may change the config (and anything nested
+            # in it), so never hand out the cached dictionary itself
+            return copy.deepcopy(config)
 
         except FileNotFoundError:
             if raise_if_missing:
@@ -459,6 +523,8 @@ class Parameters:
         Any dict or set parameters already defined
         will be updated by the values in the dictionary,
         otherwise values are replaced by the input values.
+        Dictionaries nested inside dict parameters are
+        also updated (recursively) instead of replaced.
 
         Parameters
         ----------
@@ -467,14 +533,12 @@ class Parameters:
         """
 
         for k, v in dictionary.items():
-            if k in self:  # need to update
-                if isinstance(self[k], set) and isinstance(v, (set, list)):
-                    self[k].update(v)
-                elif isinstance(self[k], dict) and isinstance(v, dict):
-                    self[k].update(v)
-                else:
-                    self[k] = v
-            else:  # just add this parameter
+            current = getattr(self, k, _MISSING)
+            if isinstance(current, set) and isinstance(v, (set, list, tuple)):
+                current.update(v)
+            elif isinstance(current, dict) and isinstance(v, dict):
+                _merge_dicts(current, v)
+            else:  # add a new parameter or replace the old value
                 self[k] = v
 
     def save(self, filename):
@@ -491,7 +555,7 @@ class Parameters:
         # TODO: what about combining parameters from multiple objects?
         with open(filename, "w") as file:
             outputs = {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
-            yaml.dump(outputs, file, default_flow_style=False)
+            yaml.dump(outputs, file, Dumper=YAML_DUMPER, default_flow_style=False)
 
     def to_dict(self, hidden=False):
         """
@@ -565,31 +629,12 @@ class Parameters:
 
         # default module and class_name for core classes:
         name = name.lower()
-        if name == "analysis":
-            module = "src.analysis"
-            class_name = "Analysis"
-        elif name == "simulator":
-            module = "src.simulator"
-            class_name = "Simulator"
-        elif name == "catalog":
-            module = "src.catalog"
-            class_name = "Catalog"
-        elif name == "finder":
-            module = "src.finder"
-            class_name = "Finder"
-        elif name == "quality":
-            module = "src.quality"
-            class_name = "Quality"
-        elif name == "histogram":
-            module = "src.histogram"
-            class_name = "Histogram"
-        else:
-            module = None
-            class_name = None
+        module, class_name = _core_classes.get(name, (None, None))
 
         module = getattr(self, f"{name}_module", module)
         class_name = getattr(self, f"{name}_class", class_name)
-        class_kwargs = getattr(self, f"{name}_kwargs", {})
+        # copy, so the defaults/kwargs below are not added to the parameters
+        class_kwargs = dict(getattr(self, f"{name}_kwargs", {}))
 
         if module is None or class_name is None:
             raise ValueError(
@@ -605,9 +650,7 @@ class Parameters:
         # any other arguments passed in from caller override
         class_kwargs.update(kwargs)
 
-        return getattr(__import__(module, fromlist=[class_name]), class_name)(
-            **class_kwargs
-        )
+        return _import_class(module, class_name)(**class_kwargs)
 
     def add_defaults_to_dict(self, inputs):
         """
@@ -775,13 +818,17 @@ class Parameters:
     @staticmethod
     def _get_file_from_disk(filename):
         """
-        Lazy load the file from disk. If already in the LOADED_FILES dict, will get that instead.
+        Lazy load the file from disk. If already in the LOADED_FILES dict, will get that instead
+        (unless the file was modified since it was loaded).
         """
-        if filename not in LOADED_FILES:
+        mtime = os.stat(filename).st_mtime_ns
+        cached = LOADED_FILES.get(filename)
+        if cached is None or cached[0] != mtime:
             with open(filename) as file:
-                LOADED_FILES[filename] = yaml.safe_load(file)
+                cached = (mtime, yaml.load(file, Loader=YAML_LOADER))
+            LOADED_FILES[filename] = cached
 
-        return LOADED_FILES[filename]
+        return cached[1]
 
     @classmethod
     def _get_default_cfg_key(cls):
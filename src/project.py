@@ -14,7 +14,7 @@ import sqlalchemy as sa
 
 import src.database
 from src.database import Session, CloseSession
-from src.parameters import Parameters
+from src.parameters import YAML_DUMPER, Parameters
 from src.catalog import Catalog
 from src.observatory import ParsObservatory
 from src.source import Source
@@ -107,8 +107,8 @@ class ParsProject(Parameters):
                 raise TypeError("observatories must be a list of strings")
             upper_obs.append(obs.upper())
 
-        # cast the list into a set to make each name unique
-        names = list(set(upper_obs))
+        # make each name unique, keeping the order they were given in
+        names = list(dict.fromkeys(upper_obs))
 
         super().__setattr__("obs_names", names)
 
@@ -637,7 +637,7 @@ class Project:
 
         # write the config file to disk
         with open(os.path.join(self.output_folder, "config.yaml"), "w") as f:
-            yaml.dump(cfg_dict, f, sort_keys=False)
+            yaml.dump(cfg_dict, f, Dumper=YAML_DUMPER, sort_keys=False)
 
     def _setup_output_folder(self):
         """
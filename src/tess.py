@@ -1,5 +1,7 @@
 import os
+import io
 import glob
+import threading
 import requests
 from datetime import datetime
 import numpy as np
@@ -21,6 +23,25 @@ from src.catalog import Catalog
 
 # from src.dataset import DatasetMixin, RawPhotometry, Lightcurve
 
+# timeout (in seconds) for downloading a single FITS file
+FITS_DOWNLOAD_TIMEOUT = 10.0
+
+# each download thread keeps its own HTTP session, so connections
+# to MAST are reused between files (requests sessions are not thread safe)
+_http = threading.local()
+
+
+def _get_http_session():
+    """
+    Get the requests.Session of the current thread
+    (a new one is made the first time it is needed).
+    """
+    session = getattr(_http, "session", None)
+    if session is None:
+        session = _http.session = requests.Session()
+
+    return session
+
 
 class ParsObsTESS(ParsObservatory):
 
@@ -287,13 +308,16 @@ class VirtualTESS(VirtualObservatory):
                 data1 = None
                 data2 = None
                 time_units = None
-                with fits.open(url, cache=False) as hdul:
+                # download with a pooled connection, then read from memory
+                response = _get_http_session().get(url, timeout=FITS_DOWNLOAD_TIMEOUT)
+                response.raise_for_status()
+                with fits.open(io.BytesIO(response.content)) as hdul:
                     header0 = hdul[0].header
                     data1 = hdul[1].data
                     data2 = hdul[2].data
                     time_units = hdul[1].header["TUNIT1"]
                 return header0, data1, data2, time_units
-            except socket.timeout:
+            except (socket.timeout, requests.exceptions.Timeout):
                 continue
 
         raise TimeoutError(f"Too many timeouts from trying to open fits.")
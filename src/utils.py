@@ -2,9 +2,14 @@
 Various utility functions and classes
 that were not relevant to any specific module.
 """
+import re
 import sys
+import functools
+import weakref
 from datetime import datetime, timezone
 import dateutil.parser
+import numpy as np
+import pandas as pd
 
 from inspect import signature
 from astropy.coordinates import SkyCoord
@@ -21,15 +26,16 @@ class OnClose:
     deleting things from the DB, and so on.
     It triggers even if there is an exception,
     so it is kind of like a finally block.
+    Uses weakref.finalize instead of __del__,
+    so it does not interfere with garbage collection
+    of reference cycles.
     """
 
     def __init__(self, func):
         if not callable(func):
             raise TypeError("func must be callable")
         self.func = func
-
-    def __del__(self):
-        self.func()
+        self._finalizer = weakref.finalize(self, func)
 
 
 def trim_docstring(docstring):
@@ -142,10 +148,19 @@ def print_functions(obj):
     If object doesn't have any public methods
     will print nothing.
     """
+    # collect public names directly from the class dicts
+    # (and the instance dict), instead of going through dir()
+    cls = obj if isinstance(obj, type) else type(obj)
+    namespaces = [vars(klass) for klass in cls.__mro__ if klass is not object]
+    if not isinstance(obj, type) and hasattr(obj, "__dict__"):
+        namespaces.append(vars(obj))
+
+    names = set()
+    for namespace in namespaces:
+        names.update(n for n in namespace if not n.startswith("_") and n != "help")
+
     func_list = []
-    for name in dir(obj):
-        if name.startswith("_") or name == "help":
-            continue
+    for name in sorted(names):
         func = getattr(obj, name)
         if callable(func):
             func_list.append(func)
@@ -157,25 +172,131 @@ def print_functions(obj):
         print()
 
 
+def _sexagesimal_parts(value, decimals):
+    """
+    Split a non-negative value (scalar or array)
+    into whole units, minutes and seconds.
+    The seconds are rounded to the given number of decimals
+    before splitting, so that a rounding up to 60 seconds
+    is carried into the minutes (and the whole units).
+    """
+    scale = 10**decimals
+    # total number of seconds, in units of the output precision
+    total = np.round(np.multiply(value, 3600 * scale))
+    whole, remainder = np.divmod(total, 3600 * scale)
+    minutes, seconds = np.divmod(remainder, 60 * scale)
+
+    return whole, minutes, seconds / scale
+
+
 def ra2sex(ra):
     """
     Convert an RA in degrees to a string in sexagesimal format.
+    If given an array of RA values, returns an array of strings.
     """
+    if not is_scalar(ra):
+        ra = np.asarray(ra, dtype=float)
+        if np.any((ra < 0) | (ra > 360)):
+            raise ValueError("RA out of range.")
+        hours, minutes, seconds = _sexagesimal_parts(ra / 15.0, 2)
+        return np.char.add(
+            np.char.add(
+                np.char.mod("%02d:", hours.astype(int)),
+                np.char.mod("%02d:", minutes.astype(int)),
+            ),
+            np.char.mod("%05.2f", seconds),
+        )
+
     if ra < 0 or ra > 360:
         raise ValueError("RA out of range.")
-    ra /= 15.0  # convert to hours
-    return f"{int(ra):02d}:{int((ra % 1) * 60):02d}:{((ra % 1) * 60) % 1 * 60:05.2f}"
+    hours, minutes, seconds = _sexagesimal_parts(ra / 15.0, 2)  # in hours
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:05.2f}"
 
 
 def dec2sex(dec):
     """
     Convert a Dec in degrees to a string in sexagesimal format.
+    If given an array of Dec values, returns an array of strings.
     """
+    if not is_scalar(dec):
+        dec = np.asarray(dec, dtype=float)
+        if np.any((dec < -90) | (dec > 90)):
+            raise ValueError("Dec out of range.")
+        degrees, minutes, seconds = _sexagesimal_parts(np.abs(dec), 1)
+        return np.char.add(
+            np.char.add(
+                np.char.add(
+                    np.where(dec < 0, "-", "+"),
+                    np.char.mod("%02d:", degrees.astype(int)),
+                ),
+                np.char.mod("%02d:", minutes.astype(int)),
+            ),
+            np.char.mod("%04.1f", seconds),
+        )
+
     if dec < -90 or dec > 90:
         raise ValueError("Dec out of range.")
-    return (
-        f"{int(dec):+03d}:{int((dec % 1) * 60):02d}:{((dec % 1) * 60) % 1 * 60:04.1f}"
-    )
+    sign = "-" if dec < 0 else "+"
+    degrees, minutes, seconds = _sexagesimal_parts(abs(dec), 1)
+    return f"{sign}{int(degrees):02d}:{int(minutes):02d}:{seconds:04.1f}"
+
+
+# sexagesimal strings like "18:23:21.1" or "-12 34 56.7"
+# (optional sign, integer degrees/hours and minutes, decimal seconds)
+_SEXAGESIMAL_RE = re.compile(r"^\s*([+-]?)(\d+)[:\s](\d+)[:\s](\d+(?:\.\d*)?)\s*$")
+
+
+def _parse_sexagesimal(string):
+    """
+    Parse a simple sexagesimal string into a float.
+    Returns None if the string is not in a simple format,
+    or if the minutes or seconds are out of range,
+    in which case it should be parsed (or rejected) using astropy.
+    """
+    match = _SEXAGESIMAL_RE.match(string)
+    if match is None:
+        return None
+    sign, whole, minutes, seconds = match.groups()
+    minutes = int(minutes)
+    seconds = float(seconds)
+    if minutes >= 60 or seconds >= 60:
+        return None
+    value = int(whole) + minutes / 60 + seconds / 3600
+
+    return -value if sign == "-" else value
+
+
+def _parse_sexagesimal_array(strings):
+    """
+    Parse an array of simple sexagesimal strings into floats,
+    using vectorized string operations instead of a loop.
+    Returns None if any of the strings is not in a simple format,
+    or has minutes or seconds out of range,
+    in which case the array should be parsed (or rejected) using astropy.
+    """
+    parts = pd.Series(strings.ravel()).str.extract(_SEXAGESIMAL_RE)
+    if parts[1].isna().any():
+        return None
+    minutes = parts[2].to_numpy(dtype=float)
+    seconds = parts[3].to_numpy(dtype=float)
+    if np.any(minutes >= 60) or np.any(seconds >= 60):
+        return None
+    value = parts[1].to_numpy(dtype=float) + minutes / 60 + seconds / 3600
+    value = np.where(parts[0].to_numpy() == "-", -value, value)
+
+    return value.reshape(strings.shape)
+
+
+def _as_string_array(values):
+    """
+    Convert the input into a numpy array.
+    Object arrays that contain only strings
+    (e.g., from a pandas column) are turned into string arrays.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "O" and all(isinstance(v, str) for v in values.flat):
+        values = values.astype(str)
+    return values
 
 
 def ra2deg(ra):
@@ -185,21 +306,45 @@ def ra2deg(ra):
 
     Parameters
     ----------
-    ra: scalar float or str
+    ra: scalar float or str, or array of either
         Input RA (right ascension).
         Can be given in decimal degrees or in sexagesimal string (in hours!)
         Example 1: 271.3
         Example 2: 18:23:21.1
+        Arrays (or lists/columns) of values are converted in one pass.
 
     Returns
     -------
-    ra: scalar float
+    ra: scalar float or array of floats
         The RA as a float, in decimal degrees
 
     """
-    if type(ra) == str:
-        c = SkyCoord(ra=ra, dec=0, unit=(u.hourangle, u.degree))
-        ra = c.ra.value  # output in degrees
+    if not is_scalar(ra):
+        ra = _as_string_array(ra)
+        if ra.dtype.kind == "U":
+            hours = _parse_sexagesimal_array(ra)
+            if hours is not None:
+                ra = hours * 15.0  # convert to degrees
+            else:
+                c = SkyCoord(
+                    ra=ra, dec=np.zeros(ra.shape), unit=(u.hourangle, u.degree)
+                )
+                ra = c.ra.value  # output in degrees
+        else:
+            ra = ra.astype(float)
+
+        if np.any((ra <= 0.0) | (ra >= 360.0)):
+            raise ValueError("Some values of RA are outside range (0 -> 360).")
+
+        return ra
+
+    if isinstance(ra, str):
+        hours = _parse_sexagesimal(ra)
+        if hours is not None:
+            ra = hours * 15.0  # convert to degrees
+        else:
+            c = SkyCoord(ra=ra, dec=0, unit=(u.hourangle, u.degree))
+            ra = c.ra.value  # output in degrees
     else:
         ra = float(ra)
 
@@ -216,22 +361,44 @@ def dec2deg(dec):
 
     Parameters
     ----------
-    dec: scalar float or str
+    dec: scalar float or str, or array of either
         Input declination.
         Can be given in decimal degrees or in sexagesimal string (in degrees as well)
         Example 1: +33.21 (northern hemisphere)
         Example 2: -22.56 (southern hemisphere)
         Example 3: +12.34.56.7
+        Arrays (or lists/columns) of values are converted in one pass.
 
     Returns
     -------
-    dec: scalar float
+    dec: scalar float or array of floats
         The declination as a float, in decimal degrees
 
     """
-    if type(dec) == str:
-        c = SkyCoord(ra=0, dec=dec, unit=(u.degree, u.degree))
-        dec = c.dec.value  # output in degrees
+    if not is_scalar(dec):
+        dec = _as_string_array(dec)
+        if dec.dtype.kind == "U":
+            dec_deg = _parse_sexagesimal_array(dec)
+            if dec_deg is not None:
+                dec = dec_deg
+            else:
+                c = SkyCoord(ra=np.zeros(dec.shape), dec=dec, unit=(u.degree, u.degree))
+                dec = c.dec.value  # output in degrees
+        else:
+            dec = dec.astype(float)
+
+        if np.any((dec <= -90.0) | (dec >= 90.0)):
+            raise ValueError("Some values of dec are outside range (-90 -> +90).")
+
+        return dec
+
+    if isinstance(dec, str):
+        dec_deg = _parse_sexagesimal(dec)
+        if dec_deg is not None:
+            dec = dec_deg
+        else:
+            c = SkyCoord(ra=0, dec=dec, unit=(u.degree, u.degree))
+            dec = c.dec.value  # output in degrees
     else:
         dec = float(dec)
 
@@ -262,7 +429,10 @@ def date2jd(date):
     if isinstance(date, datetime):
         t = date
     elif isinstance(date, str):
-        t = dateutil.parser.parse(date)
+        try:  # ISO-8601 strings can be parsed much faster
+            t = datetime.fromisoformat(date)
+        except ValueError:
+            t = dateutil.parser.parse(date)
     else:
         return float(date)
 
@@ -272,26 +442,43 @@ def date2jd(date):
     else:  # non naive (has timezone)
         t = t.astimezone(timezone.utc)
 
+    return _utc_datetime_to_jd(t)
+
+
+@functools.lru_cache(maxsize=4096)
+def _utc_datetime_to_jd(t):
+    """
+    Convert a UTC datetime into a Julian Date.
+    Creating an astropy Time object is slow,
+    so the results are cached for timestamps
+    that show up repeatedly.
+    """
     return Time(t).jd
 
 
+BYTES_PER_UNIT = {
+    "byte": 1,
+    "kb": 1024,
+    "mb": 1024**2,
+    "gb": 1024**3,
+    "tb": 1024**4,
+    "pb": 1024**5,
+}
+
+
 def unit_convert_bytes(units):
     """
     Convert a number of bytes into another unit.
-    Can choose "kb", "mb", or "gb", which will return
+    Can choose "kb", "mb", "gb", "tb" or "pb", which will return
     the appropriate number of bytes in that unit.
     If "bytes" or any other string, will return 1,
     i.e., no conversion.
     """
+    units = units.lower()
     if units.endswith("s"):
         units = units[:-1]
 
-    return {
-        "byte": 1,
-        "kb": 1024,
-        "mb": 1024**2,
-        "gb": 1024**3,
-    }.get(units.lower(), 1)
+    return BYTES_PER_UNIT.get(units, 1)
 
 
 def is_scalar(value):
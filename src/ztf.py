@@ -9,6 +9,7 @@ from ztfquery import lightcurve
 
 from src.source import angle_diff
 from src.observatory import VirtualObservatory, ParsObservatory
+from src.parameters import YAML_LOADER
 from src.dataset import RawPhotometry, Lightcurve
 from src.utils import help_with_class, help_with_object
 from src.utils import ra2deg, dec2deg, date2jd
@@ -246,13 +247,12 @@ class VirtualZTF(VirtualObservatory):
         dec_col = dataset.colmap["dec"]
 
         # all filters in this dataset
-        filters = list(set(data[filt_col]))
+        filters = list(data[filt_col].unique())
 
         # split the dataset into oids
         oid_dfs = []
-        object_ids = list(set(data["oid"]))
-        for oid in object_ids:
-            new_oid_df = data[data["oid"] == oid]
+        # split all object IDs in one pass (in order of appearance)
+        for _, new_oid_df in data.groupby("oid", sort=False):
             bad_idx = (new_oid_df[flag_col] != 0) | (new_oid_df[mag_col].isna())
             df = new_oid_df[~bad_idx].reset_index(
                 drop=True, inplace=False
@@ -268,7 +268,7 @@ class VirtualZTF(VirtualObservatory):
 
             # check the source magnitude is within the range
             if source and source.mag is not None and mag_range:
-                mag = df[mag_col]
+                mag = df[mag_col].to_numpy()
                 if np.all(np.isnan(mag)):
                     continue
                 mag_diff = abs(source.mag - np.nanmedian(mag))
@@ -277,7 +277,7 @@ class VirtualZTF(VirtualObservatory):
 
             # verify that all data for the same oid
             # has the same filter
-            if len(list(set(df[filt_col]))) > 1:
+            if len(df[filt_col].unique()) > 1:
                 raise ValueError(
                     f"Expected all data for the same oid to have the same filter, "
                     f"but the oid {df['oid'].iloc[0]} had filters {filters}."
@@ -286,9 +286,11 @@ class VirtualZTF(VirtualObservatory):
 
         # split the data into lightcurves
         # based on the gap between observations
-        data = pd.concat(oid_dfs)
-        data_sort = data.sort_values(by=[time_col], inplace=False)
-        data_sort.reset_index(drop=True)
+        if len(oid_dfs) == 1:
+            data = oid_dfs[0]  # no need to copy a single oid into a new frame
+        else:
+            data = pd.concat(oid_dfs, ignore_index=True, copy=False)
+        data_sort = data.sort_values(by=[time_col], ignore_index=True)
 
         dt = np.diff(mjd_conversion(data_sort[time_col]))
 
@@ -343,7 +345,7 @@ class VirtualZTF(VirtualObservatory):
             basepath = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
             try:
                 with open(os.path.join(basepath, "credentials.yaml")) as f:
-                    creds = yaml.safe_load(f)
+                    creds = yaml.load(f, Loader=YAML_LOADER)
                     username = creds["ztf"]["username"]
                     password = creds["ztf"]["password"]
             except Exception:
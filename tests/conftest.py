@@ -1,5 +1,6 @@
 import os
 import uuid
+import yaml
 import numpy as np
 import pandas as pd
 
@@ -10,6 +11,7 @@ import sqlalchemy as sa
 from src.database import Session
 from src.catalog import Catalog
 from src.source import Source
+from src.parameters import YAML_DUMPER
 from src.project import Project
 from src.dataset import RawPhotometry, Lightcurve
 from src.finder import Finder
@@ -30,6 +32,72 @@ def wd_cat():
     return c
 
 
+@pytest.fixture(scope="session")
+def default_test_config(tmp_path_factory):
+    """
+    Write a config file (default_test.yaml)
+    and a matching passwords file, once per session.
+    The files are written into a temporary folder,
+    not into the shared configs folder, so they are
+    only used by tests that ask for them explicitly
+    (e.g., using cfg_file=default_test_config["filename"]).
+    Yields a dictionary with the config data and the filenames.
+    """
+    folder = tmp_path_factory.mktemp("configs")
+    filename = str(folder / "default_test.yaml")
+    passwords_filename = str(folder / "passwords_test.yaml")
+
+    data = {
+        "project": {  # project wide definitions
+            "description": str(uuid.uuid4()),  # random string
+            "obs_names": ["demo", "ztf"],  # list of observatory names
+        },
+        "observatories": {  # general instructions to pass to observatories
+            "reducer": {  # should be overriden by observatory reducer
+                "reducer_key": "project_reduction",
+            },
+            "demo": {  # demo observatory specific definitions
+                "demo_boolean": False,
+                "demo_string": "test-string",
+            },
+            "ztf": {
+                "credentials": {
+                    "filename": passwords_filename,
+                },
+                "reducer": {
+                    "reducer_key": "ztf_reduction",
+                },
+            },
+        },
+        "catalog": {"default": "test"},  # catalog definitions
+        "analysis": {
+            "num_injections": 2.5,
+        },
+    }
+
+    # make config and passwords file
+    with open(filename, "w") as file:
+        yaml.dump(data, file, sort_keys=False, Dumper=YAML_DUMPER)
+    with open(passwords_filename, "w") as file:
+        password = str(uuid.uuid4())
+        yaml.dump(
+            {"ztf": {"username": "test-username", "password": password}},
+            file,
+            sort_keys=False,
+            Dumper=YAML_DUMPER,
+        )
+
+    try:
+        yield {
+            "data": data,
+            "filename": filename,
+            "passwords_filename": passwords_filename,
+        }
+    finally:
+        os.remove(filename)
+        os.remove(passwords_filename)
+
+
 @pytest.fixture
 def new_source():
     source = Source(
@@ -13,15 +13,22 @@ from astropy.time import Time
 import sqlalchemy as sa
 from sqlalchemy.exc import IntegrityError
 
-from src.utils import OnClose
-from src.parameters import Parameters
+from src.utils import OnClose, ra2deg, dec2deg, ra2sex, dec2sex
+from src.parameters import YAML_DUMPER, YAML_LOADER, Parameters
 from src.project import Project
 from src.observatory import VirtualDemoObs
 from src.ztf import VirtualZTF
 
 from src.database import Session
 from src.source import Source, DEFAULT_PROJECT
-from src.dataset import RawPhotometry, Lightcurve, PHOT_ZP, simplify, get_time_offset
+from src.dataset import (
+    DatasetMixin,
+    RawPhotometry,
+    Lightcurve,
+    PHOT_ZP,
+    simplify,
+    get_time_offset,
+)
 from src.observatory import VirtualDemoObs
 from src.catalog import Catalog
 from src.detection import Detection
@@ -37,7 +44,7 @@ def test_load_save_parameters(data_dir):
     # write an example parameters file
     with open(filename, "w") as file:
         data = {"username": "guy", "password": "12345"}
-        yaml.dump(data, file, sort_keys=False)
+        yaml.dump(data, file, sort_keys=False, Dumper=YAML_DUMPER)
 
     try:
         # create some parameters object
@@ -64,7 +71,7 @@ def test_load_save_parameters(data_dir):
         filename = "parameters_test_saved.yaml"
         pars.save(filename)
         with open(filename) as file:
-            new_data = yaml.safe_load(file)
+            new_data = yaml.load(file, Loader=YAML_LOADER)
             print(new_data)
         assert {
             "username",
@@ -84,6 +91,28 @@ def test_load_save_parameters(data_dir):
         os.remove(filename)
 
 
+def test_update_parameters():
+    pars = Parameters()
+    pars.names = {"a", "b"}
+    pars.nested = {"outer": 1, "inner": {"x": 1, "y": 2}}
+    inner = pars.nested["inner"]
+
+    pars.update(
+        {
+            "names": ["c"],
+            "nested": {"inner": {"y": 3, "z": 4}},
+            "new_parameter": 5,
+        }
+    )
+
+    assert pars.names == {"a", "b", "c"}
+    assert pars.nested == {"outer": 1, "inner": {"x": 1, "y": 3, "z": 4}}
+    assert pars.new_parameter == 5
+
+    # the original nested dictionary is not modified
+    assert inner == {"x": 1, "y": 2}
+
+
 def test_default_project():
     proj = Project("default_test", catalog_kwargs={"default": "test"})
     assert proj.pars.obs_names == ["DEMO"]
@@ -130,105 +159,49 @@ def test_project_user_inputs():
     assert proj.observatories["demo"].pars.reducer["reducer_key"] == "reducer_value2"
 
 
-def test_project_config_file(data_dir):
-    project_str1 = str(uuid.uuid4())
+def test_project_config_file(default_test_config):
+    project_str1 = default_test_config["data"]["project"]["description"]
     project_str2 = str(uuid.uuid4())
+    cfg_file = default_test_config["filename"]
+
+    # do not load the config file
+    proj = Project("default_test", catalog_kwargs={"default": "test"}, cfg_file=False)
+    assert proj.pars.description == ""
+
+    # load the config file written by the fixture
+    proj = Project("default_test", cfg_file=cfg_file)
+    assert "description" in proj.pars
+    assert proj.pars.description == project_str1
+    assert proj.analysis.pars.num_injections == 2.5
+
+    # check the observatories were loaded correctly
+    assert "demo" in proj.observatories
+    assert isinstance(proj.observatories["demo"], VirtualDemoObs)
+    # existing parameters should be overridden by the config file
+    assert proj.observatories["demo"].pars.demo_boolean is False
+    # new parameter is successfully added
+    assert proj.observatories["demo"].pars.demo_string == "test-string"
+    # general project-wide reducer is used by demo observatory:
+    assert proj.observatories["demo"].pars.reducer["reducer_key"] == "project_reduction"
+
+    # check the ZTF calibration/analysis got their own parameters loaded
+    assert "ztf" in proj.observatories
+    assert isinstance(proj.observatories["ztf"], VirtualZTF)
+    assert proj.observatories["ztf"].pars.reducer == {"reducer_key": "ztf_reduction"}
 
-    data = {
-        "project": {  # project wide definitions
-            "description": project_str1,  # random string
-            "obs_names": ["demo", "ztf"],  # list of observatory names
-        },
-        "observatories": {  # general instructions to pass to observatories
-            "reducer": {  # should be overriden by observatory reducer
-                "reducer_key": "project_reduction",
-            },
-            "demo": {  # demo observatory specific definitions
-                "demo_boolean": False,
-                "demo_string": "test-string",
-            },
-            "ztf": {
-                "credentials": {
-                    "filename": os.path.abspath(
-                        os.path.join(data_dir, "passwords_test.yaml")
-                    ),
-                },
-                "reducer": {
-                    "reducer_key": "ztf_reduction",
-                },
-            },
-        },
-        "catalog": {"default": "test"},  # catalog definitions
-        "analysis": {
-            "num_injections": 2.5,
+    # check the user inputs override the config file
+    proj = Project(
+        "default_test",
+        cfg_file=cfg_file,
+        description=project_str2,
+        obs_kwargs={
+            "demo": {
+                "demo_string": "new-test-string"
+            },  # directly override demo parameters
         },
-    }
-
-    # make config and passwords file
-    configs_folder = os.path.abspath(os.path.join(data_dir, "../configs"))
-
-    if not os.path.isdir(configs_folder):
-        os.mkdir(configs_folder)
-    filename = os.path.join(configs_folder, "default_test.yaml")
-    with open(filename, "w") as file:
-        yaml.dump(data, file, sort_keys=False)
-    with open(data["observatories"]["ztf"]["credentials"]["filename"], "w") as file:
-        password = str(uuid.uuid4())
-        yaml.dump(
-            {"ztf": {"username": "test-username", "password": password}},
-            file,
-            sort_keys=False,
-        )
-
-    try:
-        # do not load the config file
-        proj = Project(
-            "default_test", catalog_kwargs={"default": "test"}, cfg_file=False
-        )
-        assert proj.pars.description == ""
-
-        # load the default config file at configs/default_test.yaml
-        proj = Project("default_test")
-        assert "description" in proj.pars
-        assert proj.pars.description == project_str1
-        assert proj.analysis.pars.num_injections == 2.5
-
-        # check the observatories were loaded correctly
-        assert "demo" in proj.observatories
-        assert isinstance(proj.observatories["demo"], VirtualDemoObs)
-        # existing parameters should be overridden by the config file
-        assert proj.observatories["demo"].pars.demo_boolean is False
-        # new parameter is successfully added
-        assert proj.observatories["demo"].pars.demo_string == "test-string"
-        # general project-wide reducer is used by demo observatory:
-        assert (
-            proj.observatories["demo"].pars.reducer["reducer_key"]
-            == "project_reduction"
-        )
-
-        # check the ZTF calibration/analysis got their own parameters loaded
-        assert "ztf" in proj.observatories
-        assert isinstance(proj.observatories["ztf"], VirtualZTF)
-        assert proj.observatories["ztf"].pars.reducer == {
-            "reducer_key": "ztf_reduction"
-        }
-
-        # check the user inputs override the config file
-        proj = Project(
-            "default_test",
-            description=project_str2,
-            obs_kwargs={
-                "demo": {
-                    "demo_string": "new-test-string"
-                },  # directly override demo parameters
-            },
-        )
-        assert proj.pars.description == project_str2
-        assert proj.observatories["demo"].pars.demo_string == "new-test-string"
-
-    finally:
-        os.remove(filename)
-        os.remove(data["observatories"]["ztf"]["credentials"]["filename"])
+    )
+    assert proj.pars.description == project_str2
+    assert proj.observatories["demo"].pars.demo_string == "new-test-string"
 
 
 def test_version_control(data_dir):
@@ -336,6 +309,24 @@ def test_catalog_wds():
     assert abs(cat.data[cat.pars.mag_column].mean() - 20) < 0.1
 
 
+def test_catalog_get_rows():
+    cat = Catalog(default="wds")
+    cat.load()
+
+    # getting many rows at once should give the same results as one by one
+    for obstime in [None, 2018.5]:
+        rows = cat.get_rows(10, 20, obstime=obstime)
+        assert len(rows) == 10
+        for i, row in enumerate(rows):
+            expected = cat.get_row(10 + i, "number", "dict", obstime=obstime)
+            assert row.keys() == expected.keys()
+            for k, v in expected.items():
+                if isinstance(v, float):
+                    assert abs(row[k] - v) < 1e-9
+                else:
+                    assert row[k] == v
+
+
 def test_observatory_filename_conventions(test_project):
     obs = test_project.observatories["demo"]
 
@@ -426,11 +417,12 @@ def test_add_source_and_data(data_dir):
                 altdata=dict(foo="bar"),
             )
 
-            # check the times make sense
+            # check the times make sense (up to rounding of the microseconds)
             start_time = Time(min(df.mjd), format="mjd").datetime
             end_time = Time(max(df.mjd), format="mjd").datetime
-            assert start_time == new_data.time_start
-            assert end_time == new_data.time_end
+            one_microsecond = datetime.timedelta(microseconds=1)
+            assert abs(start_time - new_data.time_start) <= one_microsecond
+            assert abs(end_time - new_data.time_end) <= one_microsecond
 
             new_source.raw_photometry.append(new_data)
             session.add(new_source)
@@ -643,7 +635,7 @@ def test_data_reduction(test_project, new_source, raw_phot_no_exptime):
         session.rollback()
 
         # must save dataset before adding it to DB
-        [lc.save(overwrite=True) for lc in lightcurves]
+        DatasetMixin.save_many(lightcurves, overwrite=True)
         filenames = [lc.get_fullname() for lc in lightcurves]
 
         session.add(new_source)
@@ -805,12 +797,13 @@ def test_reduced_data_file_keys(test_project, new_source, raw_phot):
             assert basename in lc.filename
 
         # make sure all filenames are the same
-        assert lcs[0].filename == list({lc.filename for lc in lcs})[0]
+        assert all(lc.filename == lcs[0].filename for lc in lcs)
 
         # check the all the data exists in the file
         with pd.HDFStore(lcs[0].get_fullname()) as store:
+            keys = set(store.keys())  # walk the file's nodes only once
             for lc in lcs:
-                assert os.path.join("/", lc.filekey) in store.keys()
+                assert os.path.join("/", lc.filekey) in keys
                 assert len(store[lc.filekey]) == len(lc.data)
 
     finally:
@@ -822,6 +815,37 @@ def test_reduced_data_file_keys(test_project, new_source, raw_phot):
         assert not os.path.isfile(filename)
 
 
+def test_save_many_reduced_datasets(test_project, new_source, raw_phot):
+
+    obs = test_project.observatories["demo"]
+    raw_phot.altdata["exptime"] = 30.0
+    new_source.raw_photometry.append(raw_phot)
+    lcs = []
+
+    try:  # at end, delete the temp file
+        raw_phot.save(overwrite=True)
+        lcs = obs.reduce(source=new_source, data_type="photometry")
+
+        # all lightcurves are written into one file
+        DatasetMixin.save_many(lcs, overwrite=True)
+        assert len({lc.get_fullname() for lc in lcs}) == 1
+
+        with pd.HDFStore(lcs[0].get_fullname()) as store:
+            for lc in lcs:
+                assert store[lc.filekey].equals(lc.data)
+
+        # the keys already exist in the file
+        with pytest.raises(ValueError, match="already exists"):
+            DatasetMixin.save_many(lcs, overwrite=False)
+
+    finally:
+        raw_phot.delete_data_from_disk()
+        for lc in lcs:
+            lc.delete_data_from_disk()
+        for lc in lcs:
+            assert not os.path.isfile(lc.get_fullname())
+
+
 def test_reducer_with_outliers(test_project, new_source):
     num_points = 20
     outlier_indices = [5, 8, 12]
@@ -871,15 +895,17 @@ def test_reducer_with_outliers(test_project, new_source):
             session.commit()
 
             # check the data has been reduced as expected
-            df2 = df[~df["flag"]]
-            drop_idx = list(set(outlier_indices + flagged_indices))
-            df3 = df.drop(drop_idx, axis=0)
-            assert np.isclose(lc.mag_min, df2["mag"].min())
-            assert np.isclose(lc.mag_max, df2["mag"].max())
+            good = ~flag  # points that are not flagged
+            clean = good.copy()  # also remove the outliers
+            clean[outlier_indices] = False
+            mag_good = mag[good]
+            mag_clean = mag[clean]
+            assert np.isclose(lc.mag_min, mag_good.min())
+            assert np.isclose(lc.mag_max, mag_good.max())
             assert lc.num_good == num_points - len(flagged_indices)
-            assert abs(np.mean(df3["mag"]) - lc.mag_mean_robust) < 0.1
-            assert abs(np.std(df2["mag"]) - lc.mag_rms) < 0.5
-            assert abs(np.std(df3["mag"]) - lc.mag_rms_robust) < 0.1
+            assert abs(np.mean(mag_clean) - lc.mag_mean_robust) < 0.1
+            assert abs(np.std(mag_good) - lc.mag_rms) < 0.5
+            assert abs(np.std(mag_clean) - lc.mag_rms_robust) < 0.1
 
             # also check that the data is uniformly sampled
             assert lc.is_uniformly_sampled
@@ -1083,6 +1109,37 @@ def test_download_pars(test_project):
             session.commit()
 
 
+def test_sexagesimal_coordinates():
+    assert np.isclose(ra2deg("18:30:00"), 277.5)
+    assert np.isclose(dec2deg("-12 30 36"), -12.51)
+
+    # minutes and seconds must be below 60
+    with pytest.raises(ValueError, match="minute"):
+        ra2deg("18:75:00")
+    with pytest.raises(ValueError, match="minute"):
+        dec2deg("-12:75:00")
+    with pytest.raises(ValueError, match="second"):
+        ra2deg("18:05:61")
+
+    # arrays are validated the same way
+    assert np.allclose(ra2deg(["18:30:00", "06:00:00"]), [277.5, 90.0])
+    with pytest.raises(ValueError, match="minute"):
+        ra2deg(["18:30:00", "18:75:00"])
+    with pytest.raises(ValueError, match="minute"):
+        dec2deg(["-12:30:00", "-12:75:00"])
+
+    # seconds that round up to 60 are carried into the minutes/degrees
+    assert dec2sex(45.999999) == "+46:00:00.0"
+    assert dec2sex(-45.999999) == "-46:00:00.0"
+    assert ra2sex(359.9999999) == "24:00:00.00"
+    assert ra2sex(15.0 * (1 + 59.999999 / 3600)) == "01:01:00.00"
+    assert list(dec2sex([45.999999, -12.25])) == ["+46:00:00.0", "-12:15:00.0"]
+    assert list(ra2sex([271.3, 15.0 * (1 + 59.999999 / 3600)])) == [
+        "18:05:12.00",
+        "01:01:00.00",
+    ]
+
+
 @pytest.mark.flaky(max_runs=3)
 def test_histogram():
 
@@ -1245,6 +1302,54 @@ def test_histogram():
     assert h.data.mag.attrs["overflow"] == num_points3
 
 
+def test_histogram_dtype_promotion():
+    h = Histogram()
+    h.pars.dtype = "uint8"
+    h.pars.score_coords = {"snr": (-10, 10, 0.1)}
+    h.pars.source_coords = {}
+    h.pars.obs_coords = {"filt": ()}
+    h.initialize()
+
+    # all the values go into the same bin
+    num_points = 200
+    df = pd.DataFrame(dict(snr=np.zeros(num_points), filt="R"))
+    h.add_data(df)
+    assert h.data.snr_counts.dtype == np.uint8
+    assert h.data.snr_counts.max() == num_points
+
+    # this would overflow a uint8, so the array is promoted
+    h.add_data(df)
+    assert h.data.snr_counts.dtype == np.uint16
+    assert h.data.snr_counts.max() == 2 * num_points
+    assert h.data.snr_counts.sum() == 2 * num_points
+
+
+def test_histogram_nan_scores():
+    h = Histogram()
+    h.pars.dtype = "uint32"
+    h.pars.score_coords = {"snr": (-10, 10, 0.1)}
+    h.pars.source_coords = {}
+    h.pars.obs_coords = {"filt": ()}
+    h.initialize()
+
+    # non-finite scores are dropped, and not counted as over/underflow
+    snr = [1, np.nan, np.nan, 2, np.inf, -np.inf, 100, -100]
+    df = pd.DataFrame(dict(snr=snr, filt="R"))
+    h.add_data(df)
+    assert h.data.snr_counts.sum() == 2
+    assert h.data.snr.attrs["overflow"] == 1
+    assert h.data.snr.attrs["underflow"] == 1
+
+    # a histogram without any score axes has nothing to fill
+    h = Histogram()
+    h.pars.score_coords = {}
+    h.pars.source_coords = {}
+    h.pars.obs_coords = {"filt": ()}
+    h.initialize()
+    h.add_data(df)
+    assert len(h.data.data_vars) == 0
+
+
 @pytest.mark.flaky(max_runs=5)
 def test_finder(simple_finder, new_source, lightcurve_factory):
 
@@ -1385,8 +1490,7 @@ def test_analysis(analysis, new_source, raw_phot):
         new_source.reset_analysis()
         # make sure to save the raw/reduced data first
         raw_phot.save()
-        for lc in new_source.reduced_lightcurves:
-            lc.save()
+        DatasetMixin.save_many(new_source.reduced_lightcurves)
 
         analysis.analyze_sources(new_source)
         assert len(new_source.detections) == 1